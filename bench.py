@@ -0,0 +1,202 @@
+##########################################################################
+# Benchmark Harness
+# ECE 358 (shared by the benchmarks of the labs)
+#
+# Runs the cases of a lab's benchmark (see Benchmark), each in a fresh
+# process, and records the wall time, events per second and memory of
+# each. A case is repeated until it has run for at least a minimum wall
+# time, over several rounds through all cases, and its fastest run is
+# kept, so short cases are not at the mercy of timer and scheduling noise. Its memory is the growth of the peak RSS over
+# the RSS the process had once the simulator was imported, so the
+# interpreter and NumPy do not drown out the case. Results can be saved as
+# a baseline JSON file and later runs compared against it; a case that is
+# slower or larger than the baseline by more than the tolerance fails the
+# run, and so does a missing baseline or a case the baseline does not have.
+##########################################################################
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+####################################################
+############### Benchmark Constants ################
+####################################################
+SEED = 358                  # seed of every case, so runs are comparable
+TOLERANCE = 0.2             # allowed relative slowdown/growth before failing
+MIN_WALL_TIME = 0.1         # default wall time each case is repeated for in a round [s]
+ROUNDS = 5                  # default number of rounds over the cases
+RSS_SLACK = 1024            # RSS growth always allowed, on top of the tolerance [KB]
+
+# Benchmark of a simulator
+# Every lab subclasses it with its command line description (DESCRIPTION),
+# suites (SUITES), default baseline file (BASELINE) and the CSV header of
+# the fields of its cases (COLUMNS), and defines how its cases are built,
+# named and run. Cases are namedtuples. Instances are sent to the worker
+# processes, so subclasses must be defined at module level.
+class Benchmark:
+    DESCRIPTION = None          # description of the command line
+    SUITES = None               # base simulation time of each suite
+    BASELINE = None             # path of the default baseline file
+    COLUMNS = None              # CSV header of the fields of a case
+
+    # Build the cases of a suite
+    # @param base_time - int:       Base simulation time of the suite.
+    # @return list[namedtuple]:     The cases.
+    def build_cases(self, base_time):
+        raise NotImplementedError
+
+    # Get the name of a case
+    # @param case - namedtuple:     The case.
+    # @return str:                  Unique name of the case, used as its key in the baseline.
+    def name(self, case):
+        raise NotImplementedError
+
+    # Run a case once
+    # @param case - namedtuple:     The case to run.
+    # @return int:                  Number of events the simulation processed.
+    def run(self, case):
+        raise NotImplementedError
+
+# Measure a case
+# Runs in a fresh worker process, which has imported the simulator by the
+# time it gets here. Every run of a case is identically seeded, so all of
+# them process the same events.
+# @param benchmark - Benchmark:     Benchmark of the case.
+# @param case - namedtuple:         The case to measure.
+# @param min_wall_time - float:     Wall time to repeat the case for [s].
+# @return dict:                     Measurements of the case.
+def measure(benchmark, case, min_wall_time):
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    wall_time = float('inf')
+    repeats = 0
+    start = time.perf_counter()
+    while repeats == 0 or time.perf_counter() - start < min_wall_time:
+        run_start = time.perf_counter()
+        events = benchmark.run(case)
+        wall_time = min(wall_time, time.perf_counter() - run_start)
+        repeats += 1
+
+    return {
+        'events': events,
+        'repeats': repeats,
+        'wall_time': wall_time,
+        'events_per_sec': events / wall_time,
+        'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base_rss,
+    }
+
+# Run cases, each in a fresh process
+# The cases are run in rounds, one after the other in every round, and each
+# case keeps its best measurements of all rounds. The speed of a shared
+# machine drifts over seconds, which repeating a case back to back cannot
+# average out, while a slow spell rarely covers a case in every round.
+# @param benchmark - Benchmark:         Benchmark of the cases.
+# @param cases - list[namedtuple]:      The cases to run.
+# @param min_wall_time - float:         Wall time to repeat each case for in a round [s].
+# @param rounds - int:                  Number of rounds.
+# @return generator[(namedtuple, dict)]: Cases and their measurements (as the last round
+#                                       runs them).
+def run_cases(benchmark, cases, min_wall_time, rounds):
+    context = multiprocessing.get_context('spawn')
+    best = {}
+    for round_index in range(rounds):
+        for index, case in enumerate(cases):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                measurement = executor.submit(measure, benchmark, case, min_wall_time).result()
+            if index in best:
+                previous = best[index]
+                measurement['repeats'] += previous['repeats']
+                if previous['wall_time'] < measurement['wall_time']:
+                    measurement['wall_time'] = previous['wall_time']
+                    measurement['events_per_sec'] = previous['events_per_sec']
+                measurement['rss_kb'] = min(measurement['rss_kb'], previous['rss_kb'])
+            best[index] = measurement
+            if round_index == rounds - 1:
+                yield case, measurement
+
+# Compare measurements against a baseline
+# Every case is seeded, so it does the same work each time it runs, and a
+# slowdown shows as a longer wall time. This holds even for a change that
+# alters the number of events a case processes.
+# @param current - dict:            Measurements of this run, keyed by case name.
+# @param baseline - dict:           Measurements of the baseline, keyed by case name.
+# @param tolerance - float:         Allowed relative slowdown or growth.
+# @return (list[str], list[str]):   Descriptions of the regressions, and the names
+#                                   of the cases missing from the baseline.
+def compare(current, baseline, tolerance):
+    regressions = []
+    missing = []
+    for name, measurement in current.items():
+        if name not in baseline:
+            missing.append(name)
+            continue
+        reference = baseline[name]
+        if measurement['wall_time'] > reference['wall_time'] * (1 + tolerance):
+            regressions.append('%s: %.4f s (%.0f events/s), baseline %.4f s (%.0f events/s)'
+                               % (name, measurement['wall_time'], measurement['events_per_sec'],
+                                  reference['wall_time'], reference['events_per_sec']))
+        if measurement['rss_kb'] > max(reference['rss_kb'] * (1 + tolerance), reference['rss_kb'] + RSS_SLACK):
+            regressions.append('%s: RSS %d KB, baseline %d KB'
+                               % (name, measurement['rss_kb'], reference['rss_kb']))
+    return regressions, missing
+
+# Run a benchmark based on the command line options provided
+# @param benchmark - Benchmark:     The benchmark to run.
+def main(benchmark):
+    parser = argparse.ArgumentParser(description=benchmark.DESCRIPTION)
+    parser.add_argument('-s', '--suite', choices=sorted(benchmark.SUITES), default='quick',
+                        help='Benchmark suite to run (default: quick)')
+    parser.add_argument('-b', '--baseline', metavar='path', default=benchmark.BASELINE,
+                        help='Baseline JSON file (default: bench_baseline.json)')
+    parser.add_argument('--save', action='store_true',
+                        help='Save the results as the new baseline instead of comparing')
+    parser.add_argument('--report', action='store_true',
+                        help='Only report the results, without comparing against a baseline')
+    parser.add_argument('--tolerance', metavar='t', type=float, default=TOLERANCE,
+                        help='Allowed relative slowdown or RSS growth (default: %g)' % TOLERANCE)
+    parser.add_argument('--min_time', metavar='s', type=float, default=MIN_WALL_TIME,
+                        help='Wall time each case is repeated for in a round, keeping its fastest run '
+                             '(default: %g)' % MIN_WALL_TIME)
+    parser.add_argument('--rounds', metavar='r', type=int, default=ROUNDS,
+                        help='Number of rounds over the cases, keeping the best of each case '
+                             '(default: %d)' % ROUNDS)
+
+    args = parser.parse_args()
+
+    print(benchmark.COLUMNS + ',Events,Repeats,Wall time [s],Events/s,RSS [KB]')
+    current = {}
+    for case, measurement in run_cases(benchmark, benchmark.build_cases(benchmark.SUITES[args.suite]),
+                                       args.min_time, args.rounds):
+        current[benchmark.name(case)] = measurement
+        print('%s,%d,%d,%.4f,%.0f,%d' % (','.join(str(field) for field in case), measurement['events'],
+                                         measurement['repeats'], measurement['wall_time'],
+                                         measurement['events_per_sec'], measurement['rss_kb']),
+              flush=True)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+        print('Saved baseline to ' + args.baseline)
+        return
+    if args.report:
+        return
+
+    if not os.path.exists(args.baseline):
+        print('ERROR no baseline at ' + args.baseline + ' (run with --save to create one, '
+              'or with --report to skip the comparison)', file=sys.stderr)
+        sys.exit(1)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions, missing = compare(current, baseline, args.tolerance)
+    for name in missing:
+        print('MISSING ' + name + ' is not in the baseline', file=sys.stderr)
+    for regression in regressions:
+        print('REGRESSION ' + regression, file=sys.stderr)
+    if regressions or missing:
+        sys.exit(1)
+    print('No regressions against ' + args.baseline)
@@ -0,0 +1,825 @@
+##########################################################################
+# Discrete-Event Simulation Kernel
+# ECE 358 (shared by the simulators of the labs)
+#
+# Pending event set and event loop of a discrete-event simulation. Models
+# schedule events of their own kinds, cancel them and hand one handler per
+# kind to the run loop, which processes the events in time order until no
+# events are left (or a given time is passed). The pending events are kept
+# in a calendar queue by default, with a binary heap as fallback. Runs that
+# are simulated in batches can be cut short once their steady state is
+# known precisely enough (see SteadyState). The random variates of the
+# models are drawn in blocks from buffered streams (see VariateStream),
+# runs can be profiled (see Profiler) or traced to a binary file (see
+# TraceWriter), and sweeps of seeded runs are spread over worker processes
+# with their results cached on disk (see run_sweep() and ResultCache).
+##########################################################################
+
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import sys
+import time
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+####################################################
+################ Kernel Constants ##################
+####################################################
+SCHEDULER_CALENDAR = 'calendar'
+SCHEDULER_HEAP = 'heap'
+SCHEDULERS = [SCHEDULER_CALENDAR, SCHEDULER_HEAP]
+CALENDAR_BUCKETS = 2        # initial number of buckets of a calendar queue
+CALENDAR_SAMPLE = 25        # number of earliest events sampled to size the buckets
+VARIATE_BLOCK = 4096        # default number of variates drawn per refill of a stream
+PROFILE_INTERVAL = 10.0     # default wall time between progress reports [s]
+PROFILE_CHECK = 1 << 14     # default events between checks of the wall clock
+
+####################################################
+############### Trace Constants ####################
+####################################################
+TRACE_MAGIC = b'ECE358TR'
+TRACE_VERSION = 2
+TRACE_HEADER = struct.Struct('<8sIIQd')     # magic, version, record size, number of records, end time
+TRACE_RECORD = struct.Struct('<diiiI')      # time, node, value (e.g. queue length), collision count, event type
+TRACE_CHUNK = 1 << 16                       # number of records the trace file grows by
+
+####################################################
+############# Output Analysis Constants ############
+####################################################
+MSER_BATCH = 5              # batches averaged per observation of the warm-up detection (MSER-5)
+STEADY_MIN_BATCHES = 100    # batches before the stopping rule is first checked
+STEADY_GROUPS = 20          # number of batch means of the confidence intervals
+
+# Two-sided 95% Student t quantiles for 1 to 30 degrees of freedom
+T_QUANTILES_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                  2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+                  2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+# Events
+# An event is the tuple (time, priority, seq, kind, data). Events are
+# processed in order of time, then priority (lowest first), then the order
+# they were scheduled in (seq), so every scheduler processes simultaneous
+# events in the same order. The tuple itself is the handle of the event, e.g.
+# to cancel it.
+
+# Binary heap
+# Pending event set in a binary heap. Cancelled events stay in the heap and
+# are discarded once they reach the top. Insert and pop are O(log n).
+class HeapQueue:
+    def __init__(self):
+        self.heap = []                          # pending events, cancelled ones included
+        self.cancelled = set()                  # seqs of the cancelled events still in the heap
+
+    def __len__(self):
+        return len(self.heap) - len(self.cancelled)
+
+    # Add an event
+    # @param event - tuple: The event.
+    def push(self, event):
+        heapq.heappush(self.heap, event)
+
+    # Remove an event
+    # @param event - tuple: The event, which must be pending.
+    def remove(self, event):
+        self.cancelled.add(event[2])
+
+    # Remove the earliest event
+    # @return tuple: The earliest event (None if there are no events).
+    def pop(self):
+        heap = self.heap
+        cancelled = self.cancelled
+        while heap:
+            event = heapq.heappop(heap)
+            if event[2] not in cancelled:
+                return event
+            cancelled.discard(event[2])
+        return None
+
+    # Find the events in a time window
+    # @param t_start - float:   Start of the window.
+    # @param t_end - float:     End of the window.
+    # @return list[tuple]:      Events with t_start <= time <= t_end, in no particular order.
+    def window(self, t_start, t_end):
+        cancelled = self.cancelled
+        return [event for event in self.heap
+                if t_start <= event[0] <= t_end and event[2] not in cancelled]
+
+# Calendar queue
+# Pending event set in a calendar queue (R. Brown, 1988). Time is divided
+# into slots of equal width and slot k goes into bucket k mod n, like the
+# days of a year on a desk calendar. Each bucket is a sorted list, so the
+# next event is the head of the current slot's bucket, found by stepping
+# through the buckets from the last event's slot. The number of buckets
+# follows the number of events and the width follows their spacing, so a
+# bucket holds a few events and insert and pop are O(1) amortized. Events
+# are removed eagerly, and the events in a time window are found by
+# visiting the window's slots only.
+class CalendarQueue:
+    def __init__(self):
+        self.size = 0                           # number of pending events
+        self.setup([], CALENDAR_BUCKETS, 1.0, 0)
+
+    def __len__(self):
+        return self.size
+
+    # Lay out the buckets and insert events into them
+    # @param events - list[tuple]:  The events to insert.
+    # @param n - int:               Number of buckets.
+    # @param width - float:         Width of a slot.
+    # @param slot - int:            Slot to start searching for the next event at.
+    def setup(self, events, n, width, slot):
+        self.buckets = [[] for _ in range(n)]
+        self.n = n
+        self.width = width
+        self.slot = slot                        # slot of the last popped event
+        for event in events:
+            self.buckets[int(event[0] / width) % n].append(event)
+        for bucket in self.buckets:
+            bucket.sort()
+
+    # Resize the calendar
+    # The width becomes three times the average spacing of the earliest
+    # events, leaving out spacings over twice the average (e.g. the gap to
+    # an event far in the future).
+    # @param n - int: New number of buckets.
+    def resize(self, n):
+        events = [event for bucket in self.buckets for event in bucket]
+        times = sorted(event[0] for event in events)[:CALENDAR_SAMPLE]
+        width = self.width
+        if len(times) > 1:
+            gaps = [b - a for a, b in zip(times, times[1:])]
+            average = sum(gaps) / len(gaps)
+            gaps = [gap for gap in gaps if gap <= 2 * average]
+            if gaps and sum(gaps) > 0:
+                width = 3 * sum(gaps) / len(gaps)
+        self.setup(events, n, width, int(times[0] / width) if times else 0)
+
+    # Add an event
+    # @param event - tuple: The event.
+    def push(self, event):
+        slot = int(event[0] / self.width)
+        insort(self.buckets[slot % self.n], event)
+        if slot < self.slot:
+            self.slot = slot
+        self.size += 1
+        if self.size > 2 * self.n:
+            self.resize(2 * self.n)
+
+    # Remove an event
+    # @param event - tuple: The event, which must be pending.
+    def remove(self, event):
+        bucket = self.buckets[int(event[0] / self.width) % self.n]
+        del bucket[bisect_left(bucket, event)]
+        self.size -= 1
+        if self.size < self.n // 2 - 2:
+            self.resize(self.n // 2)
+
+    # Remove the earliest event
+    # @return tuple: The earliest event (None if there are no events).
+    def pop(self):
+        if self.size == 0:
+            return None
+        buckets = self.buckets
+        n = self.n
+        width = self.width
+        slot = self.slot
+        bucket = buckets[slot % n]
+        if not bucket or int(bucket[0][0] / width) > slot:
+            # Step through a year of slots, starting after the last event's slot
+            for slot in range(slot + 1, slot + n):
+                bucket = buckets[slot % n]
+                if bucket and int(bucket[0][0] / width) <= slot:
+                    break
+            else:
+                # No event within a year; jump to the earliest one
+                slot = int(min(bucket[0] for bucket in buckets if bucket)[0] / width)
+                bucket = buckets[slot % n]
+            self.slot = slot
+        self.size -= 1
+        event = bucket.pop(0)
+        if self.size < n // 2 - 2:
+            self.resize(n // 2)
+        return event
+
+    # Find the events in a time window
+    # @param t_start - float:   Start of the window.
+    # @param t_end - float:     End of the window.
+    # @return list[tuple]:      Events with t_start <= time <= t_end, in no particular order.
+    def window(self, t_start, t_end):
+        first = int(t_start / self.width)
+        last = int(t_end / self.width)
+        if last - first >= self.n:
+            slots = range(self.n)
+        else:
+            slots = range(first, last + 1)
+        events = []
+        for slot in slots:
+            bucket = self.buckets[slot % self.n]
+            for event in bucket[bisect_left(bucket, (t_start,)):]:
+                if event[0] > t_end:
+                    break
+                events.append(event)
+        return events
+
+# Simulator
+# Clock and pending event set of a simulation.
+class Simulator:
+    def __init__(self, scheduler=SCHEDULER_CALENDAR):
+        if scheduler == SCHEDULER_HEAP:
+            self.queue = HeapQueue()
+        else:
+            self.queue = CalendarQueue()
+        self.now = 0.0                          # time of the event being processed
+        self.seq = 0                            # number of events scheduled so far
+
+    # Check if there are no pending events
+    # @return bool: True if no events are pending.
+    def empty(self):
+        return len(self.queue) == 0
+
+    # Schedule an event
+    # @param t - float:         Time of the event.
+    # @param kind - int:        Kind of the event, i.e. the index of its handler.
+    # @param data - object:     Data of the event (e.g. the node it belongs to).
+    # @param priority - int:    Order among simultaneous events, lowest first
+    #                           (default: the kind).
+    # @return tuple:            The event.
+    def schedule(self, t, kind, data=None, priority=None):
+        event = (t, kind if priority is None else priority, self.seq, kind, data)
+        self.seq += 1
+        self.queue.push(event)
+        return event
+
+    # Cancel a pending event
+    # @param event - tuple: The event.
+    def cancel(self, event):
+        self.queue.remove(event)
+
+    # Remove the next event and advance the clock to it
+    # @return tuple: The next event (None if no events are pending).
+    def next(self):
+        event = self.queue.pop()
+        if event is not None:
+            self.now = event[0]
+        return event
+
+    # Find the pending events in a time window
+    # @param t_start - float:   Start of the window.
+    # @param t_end - float:     End of the window.
+    # @return list[tuple]:      Events with t_start <= time <= t_end, in no particular order.
+    def window(self, t_start, t_end):
+        return self.queue.window(t_start, t_end)
+
+    # Process events until none are left
+    # Every event is passed to the handler of its kind, which may schedule
+    # and cancel events.
+    # @param handlers - list[function]: Handler of each kind of event.
+    # @param until - float:             Stop before the first event after this
+    #                                   time, leaving it pending (None to run
+    #                                   until no events are left).
+    # @param profiler - Profiler:       Profiler to tick for every event (None
+    #                                   to not profile).
+    def run(self, handlers, until=None, profiler=None):
+        pop = self.queue.pop
+        while True:
+            event = pop()
+            if event is None:
+                return
+            if until is not None and event[0] > until:
+                self.queue.push(event)
+                return
+            self.now = event[0]
+            if profiler is not None:
+                profiler.tick(event[0])
+            handlers[event[3]](event)
+
+# Buffered variate stream
+# Stream of random variates that are generated in blocks instead of one
+# call at a time: unit exponential and unit uniform variates are drawn in
+# bulk (with NumPy when it is available, otherwise with batches of
+# random.Random calls) and scaled to the requested rate or range as they
+# are consumed, so any rate can be drawn from the same stream. Provides
+# the expovariate()/uniform()/getrandbits() methods of random.Random, so
+# either can be passed where a stream is expected.
+class VariateStream:
+    __slots__ = ('rng', 'generator', 'block_size', 'exponentials', 'uniforms', 'next_uniform')
+
+    # @param rng - random.Random:   Underlying stream (seeds the NumPy generator).
+    # @param block_size - int:      Number of variates drawn per refill.
+    def __init__(self, rng, block_size=VARIATE_BLOCK):
+        self.rng = rng                          # underlying random.Random stream
+        self.generator = None                   # NumPy generator seeded from rng
+        if np is not None:
+            self.generator = np.random.default_rng(rng.getrandbits(128))
+        self.block_size = block_size            # number of variates per refill
+        self.exponentials = iter(())            # remaining unit exponential variates
+        self.uniforms = []                      # drawn unit uniform variates
+        self.next_uniform = 0                   # index of the next unused uniform variate
+
+    # Draw a block of unit exponential variates
+    # @return list[float]:  Exponential variates with rate 1.
+    def fill_exponentials(self):
+        if self.generator is not None:
+            return self.generator.standard_exponential(self.block_size).tolist()
+        expovariate = self.rng.expovariate
+        return [expovariate(1.0) for _ in range(self.block_size)]
+
+    # Draw a block of unit uniform variates
+    # @return list[float]:  Uniform variates in [0, 1).
+    def fill_uniforms(self):
+        if self.generator is not None:
+            return self.generator.random(self.block_size).tolist()
+        rand = self.rng.random
+        return [rand() for _ in range(self.block_size)]
+
+    # Get an exponential random variable
+    # @param rate - float:  Rate of the exponential distribution.
+    # @return float:        Exponential random variable.
+    def expovariate(self, rate):
+        try:
+            return next(self.exponentials) / rate
+        except StopIteration:
+            self.exponentials = iter(self.fill_exponentials())
+            return next(self.exponentials) / rate
+
+    # Get a uniform random variable
+    # @param a - float:     Lower end of the range.
+    # @param b - float:     Upper end of the range.
+    # @return float:        Uniform random variable in [a, b).
+    def uniform(self, a, b):
+        i = self.next_uniform
+        if i == len(self.uniforms):
+            self.uniforms = self.fill_uniforms()
+            i = 0
+        self.next_uniform = i + 1
+        return a + (b - a) * self.uniforms[i]
+
+    # Look at the next unit uniform variates without using them up
+    # @param n - int:       Number of variates.
+    # @return list[float]:  The next n uniform variates in [0, 1).
+    def peek_uniforms(self, n):
+        while len(self.uniforms) - self.next_uniform < n:
+            self.uniforms = self.uniforms[self.next_uniform:] + self.fill_uniforms()
+            self.next_uniform = 0
+        return self.uniforms[self.next_uniform:self.next_uniform + n]
+
+    # Use up unit uniform variates returned by peek_uniforms()
+    # @param n - int:       Number of variates.
+    def skip_uniforms(self, n):
+        self.next_uniform += n
+
+    # Get random bits from the underlying stream (e.g. to seed NumPy)
+    # @param k - int:       Number of bits.
+    # @return int:          Random integer with k bits.
+    def getrandbits(self, k):
+        return self.rng.getrandbits(k)
+
+# Create a seeded variate stream
+# Streams are seeded by hashing the seed together with the name of the
+# stream (e.g. its purpose, or its purpose and node), so they are
+# independent of each other and of the streams of other seeds. Giving each
+# purpose its own stream means that a change in how one of them is
+# consumed does not shift the others, which is what makes common random
+# numbers between paired configurations effective.
+# @param seed - int:            Seed of the streams (None for an unseeded stream).
+# @param name - tuple:          Parts of the name of the stream.
+# @param block_size - int:      Number of variates drawn per refill.
+# @return VariateStream:        The stream.
+def seeded_stream(seed, name, block_size=VARIATE_BLOCK):
+    if seed is None:
+        return VariateStream(random.Random(), block_size)
+    return VariateStream(random.Random(':'.join(str(part) for part in (seed,) + name)), block_size)
+
+# Spawn the seed of independent substreams
+# Used to give each parallel worker or replication its own streams.
+# @param seed - int:            Seed of the streams (None for unseeded streams).
+# @param index - int:           Index of the substreams.
+# @return int:                  Seed of the substreams (None if unseeded).
+def spawn_seed(seed, index):
+    if seed is None:
+        return None
+    return random.Random("%d:spawn:%d" % (seed, index)).getrandbits(64)
+
+# Profiler
+# Opt-in instrumentation of a simulation: counts events by type, times the
+# phases of the simulation (named by the model) and reports progress
+# periodically and at the end as JSON lines on stderr. Every report carries
+# the labels the model identifies the run with.
+class Profiler:
+    # @param labels - dict:     Parameters identifying the run in the reports.
+    # @param interval - float:  Wall time between progress reports [s].
+    # @param check - int:       Events between checks of the wall clock.
+    def __init__(self, labels, interval=PROFILE_INTERVAL, check=PROFILE_CHECK):
+        self.labels = labels                    # parameters identifying the run in the reports
+        self.interval = interval                # wall time between progress reports
+        self.check = check                      # events between checks of the wall clock
+        self.counts = {}                        # number of events of each type
+        self.phases = {}                        # wall time spent in each phase
+        self.current = None                     # the phase being timed
+        self.ticks = 0                          # events since the start
+        self.sim_time = 0                       # simulated time of the latest event
+        self.start = time.perf_counter()        # wall time at the start
+        self.phase_start = self.start           # wall time at the start of the current phase
+        self.last_report = self.start           # wall time of the last progress report
+
+    # Start timing a phase, ending the current one
+    # @param name - str:    Name of the phase (None to only end the current one).
+    def phase(self, name):
+        now = time.perf_counter()
+        if self.current is not None:
+            self.phases[self.current] = self.phases.get(self.current, 0) + now - self.phase_start
+        self.current = name
+        self.phase_start = now
+
+    # Count events of a type
+    # @param name - str:    Type of the events.
+    # @param n - int:       Number of events.
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    # Record that an event was processed
+    # Every check events the wall clock is read, and a progress report is
+    # written once the interval has passed.
+    # @param sim_time - float:  Simulated time of the event.
+    def tick(self, sim_time):
+        self.ticks += 1
+        self.sim_time = sim_time
+        if self.ticks % self.check == 0:
+            now = time.perf_counter()
+            if now - self.last_report >= self.interval:
+                self.last_report = now
+                self.report(False)
+
+    # Write a report
+    # @param final - bool:  Whether this is the final report of the run.
+    # @return dict:         The report.
+    def report(self, final=True):
+        wall_time = time.perf_counter() - self.start
+        record = dict(self.labels)
+        record.update({
+            'final': final,
+            'events': self.ticks,
+            'sim_time': self.sim_time,
+            'wall_time': wall_time,
+            'events_per_sec': self.ticks / wall_time if wall_time > 0 else 0.0,
+            'sim_wall_ratio': self.sim_time / wall_time if wall_time > 0 else 0.0,
+        })
+        if final:
+            self.phase(None)
+            record['counts'] = self.counts
+            record['phases'] = self.phases
+        print(json.dumps(record), file=sys.stderr, flush=True)
+        return record
+
+# Result cache
+# Persistent cache of sweep point results in an SQLite database, shared by
+# the simulators: every simulator subclasses it with its name (SIMULATOR)
+# and source file (SOURCE). Entries are keyed by a hash of the simulator,
+# the point's full parameter set (seed included) and a hash of the
+# simulator's source and this kernel, so editing either never returns
+# stale results. Only seeded points are cached, since unseeded runs are
+# not reproducible. The least recently used entries are evicted once the
+# results take more than the size limit. Points are namedtuples with (at
+# least) the seed, profile, trace and scheduler fields; results are stored
+# as JSON, converted by encode() and decode().
+class ResultCache:
+    SIMULATOR = None            # name of the simulator
+    SOURCE = None               # path of the simulator's source file
+
+    # @param directory - str:   Directory of the cache database.
+    # @param limit - float:     Size limit of the results [MB].
+    def __init__(self, directory, limit):
+        os.makedirs(directory, exist_ok=True)
+        self.limit = limit * 1024 * 1024        # size limit of the results [bytes]
+        source = hashlib.sha256()
+        for path in (self.SOURCE, os.path.abspath(__file__)):
+            with open(path, 'rb') as f:
+                source.update(f.read())
+        self.source = source.hexdigest()
+        self.connection = sqlite3.connect(os.path.join(directory, 'results.sqlite3'))
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                                'key TEXT PRIMARY KEY, simulator TEXT NOT NULL, source TEXT NOT NULL, '
+                                'params TEXT NOT NULL, result TEXT NOT NULL, size INTEGER NOT NULL, '
+                                'last_used REAL NOT NULL)')
+
+    # Get the key of a point
+    # The profile interval, trace path and scheduler do not change the
+    # results, so they are not part of the key. Variates are drawn
+    # differently with and without NumPy, so its version is.
+    # @param point - namedtuple:    The point.
+    # @return (str, str):           The key and the parameters of the point as JSON.
+    def key(self, point):
+        params = point._asdict()
+        del params['profile']
+        del params['trace']
+        del params['scheduler']
+        params['numpy'] = np.__version__ if np is not None else None
+        params = json.dumps(params, sort_keys=True)
+        key = hashlib.sha256(('%s:%s:%s' % (self.SIMULATOR, self.source, params)).encode()).hexdigest()
+        return key, params
+
+    # Convert results to JSON-serializable data
+    # @param results - tuple:       Results of a point.
+    # @return list:                 The results as data.
+    def encode(self, results):
+        return list(results)
+
+    # Convert data back to results
+    # @param point - namedtuple:    The point of the results.
+    # @param data - list:           The results as data (see encode()).
+    # @return tuple:                The results.
+    def decode(self, point, data):
+        return tuple(data)
+
+    # Look up the results of a point
+    # Traced points are always simulated, so that their trace is written.
+    # @param point - namedtuple:    The point.
+    # @return tuple:                The cached results (None if not cached).
+    def get(self, point):
+        if point.seed is None or point.trace is not None:
+            return None
+        key, _ = self.key(point)
+        row = self.connection.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        return self.decode(point, json.loads(row[0]))
+
+    # Store the results of a point
+    # @param point - namedtuple:    The point.
+    # @param results - tuple:       Results of the point.
+    def put(self, point, results):
+        if point.seed is None:
+            return
+        key, params = self.key(point)
+        result = json.dumps(self.encode(results))
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (key, self.SIMULATOR, self.source, params, result,
+                                     len(key) + len(params) + len(result), time.time()))
+        self.evict()
+
+    # Evict the least recently used entries until the cache is within its limit
+    def evict(self):
+        total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.limit:
+            return
+        with self.connection:
+            for key, size in self.connection.execute('SELECT key, size FROM results ORDER BY last_used').fetchall():
+                if total <= self.limit:
+                    break
+                self.connection.execute('DELETE FROM results WHERE key = ?', (key,))
+                total -= size
+
+    # Invalidate cached results
+    # @param stale_only - bool: Only remove the results of other versions of
+    #                           the simulator source.
+    # @return int:              Number of removed entries.
+    def invalidate(self, stale_only=False):
+        with self.connection:
+            if stale_only:
+                cursor = self.connection.execute('DELETE FROM results WHERE simulator = ? AND source != ?',
+                                                 (self.SIMULATOR, self.source))
+            else:
+                cursor = self.connection.execute('DELETE FROM results WHERE simulator = ?', (self.SIMULATOR,))
+        return cursor.rowcount
+
+    def close(self):
+        self.connection.close()
+
+# Run a parameter sweep
+# Spread the points over a pool of worker processes and yield the results in
+# the order of the points. With a single job the points are simulated in
+# this process. With a cache, only the points missing from it are simulated
+# and their results are added to it.
+# @param run - function:        Simulates a point (module-level, so it can be
+#                               sent to the workers).
+# @param points - list[namedtuple]: The points to simulate.
+# @param jobs - int:            Number of worker processes (0 for one per CPU).
+# @param cache - ResultCache:   Cache of results (None to simulate every point).
+# @return generator[(namedtuple, object)]: Points and their results.
+def run_sweep(run, points, jobs=1, cache=None):
+    cached = {}
+    if cache is not None:
+        for index, point in enumerate(points):
+            results = cache.get(point)
+            if results is not None:
+                cached[index] = results
+    missing = [point for index, point in enumerate(points) if index not in cached]
+
+    computed = simulate_points(run, missing, jobs)
+    for index, point in enumerate(points):
+        if index in cached:
+            yield point, cached[index]
+        else:
+            results = next(computed)
+            if cache is not None:
+                cache.put(point, results)
+            yield point, results
+
+# Simulate sweep points
+# @param run - function:        Simulates a point.
+# @param points - list[namedtuple]: The points to simulate.
+# @param jobs - int:            Number of worker processes (0 for one per CPU).
+# @return generator[object]:    Results of the points, in order.
+def simulate_points(run, points, jobs):
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs == 1 or len(points) <= 1:
+        for point in points:
+            yield run(point)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(points))) as executor:
+        for results in executor.map(run, points):
+            yield results
+
+# Trace writer
+# Records simulation events as fixed-size binary records (see TRACE_RECORD)
+# in a memory-mapped file, so a trace of any length never has to be held
+# in Python lists. The file grows by TRACE_CHUNK records at a time and is
+# truncated to the records written when closed; the header then holds the
+# number of records and the time the run was simulated up to. Every record
+# holds the time, node, one value of the model's choosing (see
+# read_trace()), collision count and type of an event; fields that do not
+# apply to an event are -1.
+class TraceWriter:
+    # @param path - str:    Path of the trace file.
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w+b')
+        self.count = 0                          # number of records written
+        self.capacity = 0                       # number of records the file has room for
+        self.map = None                         # memory map of the file
+        self.grow()
+
+    # Grow the file by one chunk and remap it
+    def grow(self):
+        if self.map is not None:
+            self.map.close()
+        self.capacity += TRACE_CHUNK
+        self.file.truncate(TRACE_HEADER.size + self.capacity * TRACE_RECORD.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+    # Record an event
+    # @param t - float:         Time of the event.
+    # @param event - int:       Type of the event (defined by the model).
+    # @param node - int:        Node of the event.
+    # @param value - int:       Value of the model (e.g. the queue length after the event).
+    # @param collisions - int:  Collision count.
+    def record(self, t, event, node, value, collisions):
+        if self.count == self.capacity:
+            self.grow()
+        TRACE_RECORD.pack_into(self.map, TRACE_HEADER.size + self.count * TRACE_RECORD.size,
+                               t, node, value, collisions, event)
+        self.count += 1
+
+    # Write the header and truncate the file to the records written
+    # @param end_time - float:  Time the run was simulated up to (e.g. T);
+    #                           records past it are events that were still
+    #                           processed, such as the remaining departures.
+    def close(self, end_time):
+        TRACE_HEADER.pack_into(self.map, 0, TRACE_MAGIC, TRACE_VERSION, TRACE_RECORD.size, self.count, end_time)
+        self.map.close()
+        self.file.truncate(TRACE_HEADER.size + self.count * TRACE_RECORD.size)
+        self.file.close()
+
+# Read a trace
+# Map a trace file as a NumPy structured array without copying it. The
+# array has the fields time, node, <value>, collisions and type, and can be
+# sliced (e.g. by time) like any other array.
+# @param path - str:                Path of the trace file.
+# @param value - str:               Name of the field of the model's value.
+# @return (numpy.memmap, float):    The records of the trace, and the time the
+#                                   run was simulated up to.
+def read_trace(path, value):
+    with open(path, 'rb') as f:
+        magic, version, record_size, count, end_time = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+    if magic != TRACE_MAGIC or version != TRACE_VERSION or record_size != TRACE_RECORD.size:
+        raise ValueError(path + ' is not a trace file of this version')
+    dtype = np.dtype([('time', '<f8'), ('node', '<i4'), (value, '<i4'),
+                      ('collisions', '<i4'), ('type', '<u4')])
+    if count == 0:
+        return np.zeros(0, dtype=dtype), end_time
+    return np.memmap(path, dtype=dtype, mode='r', offset=TRACE_HEADER.size, shape=(count,)), end_time
+
+# Get the two-sided 95% Student t quantile
+# Past the table the quantile is approximated by 1.96 + 2.5/df, which is
+# within 0.002 of the exact value.
+# @param df - int:  Degrees of freedom.
+# @return float:    Quantile of the t distribution.
+def t_quantile_95(df):
+    if df <= len(T_QUANTILES_95):
+        return T_QUANTILES_95[df - 1]
+    return 1.96 + 2.5 / df
+
+# Find the warm-up of a series (MSER-5)
+# The series is averaged over groups of MSER_BATCH values, and the warm-up
+# is the number of leading groups d that minimizes the marginal standard
+# error of the remaining m - d groups, sum((z - mean)^2) / (m - d)^2
+# (White, 1997). Dropping a transient cuts the deviations by more than the
+# smaller count adds, dropping steady-state groups does not. Only the first
+# half of the groups is searched, as the statistic is erratic on the last
+# few.
+# @param values - list[float]:  The series, e.g. the means of equal batches.
+# @return (int, bool):          The number of leading values to drop (a
+#                               multiple of MSER_BATCH), and whether the
+#                               warm-up ended before the end of the search
+#                               (if not, the series is too short to tell).
+def mser5(values):
+    m = len(values) // MSER_BATCH
+    z = [sum(values[j * MSER_BATCH:(j + 1) * MSER_BATCH]) / MSER_BATCH for j in range(m)]
+    half = m // 2
+    best = float('inf')
+    warmup = 0
+    s_z = 0.0               # sum of the groups from d on
+    s_zz = 0.0              # sum of their squares
+    for d in range(m - 1, -1, -1):
+        s_z += z[d]
+        s_zz += z[d] * z[d]
+        if d > half:
+            continue
+        n = m - d
+        statistic = max(s_zz - s_z * s_z / n, 0.0) / (n * n)
+        if statistic <= best:
+            best = statistic
+            warmup = d
+    return warmup * MSER_BATCH, warmup < half
+
+# Steady state
+# Sequential stopping rule for a run that is simulated in batches of equal
+# length. Every batch gives the (y, x) sums of each statistic, estimated
+# over the batches after the warm-up as sum(y) / sum(x) (e.g. the
+# time-integral of the queue length over the batch length). The warm-up is
+# found by MSER-5 on the batch ratios of the first statistic, and the
+# batches after it are cut into STEADY_GROUPS batch means for 95%
+# confidence intervals. The run can stop as soon as the warm-up has ended
+# and every interval is within the relative precision of its estimate (or
+# is exactly zero). A statistic can have an absolute floor below which its
+# estimate is held to the precision of the floor instead, so that tiny
+# probabilities (e.g. of a loss) need not be known to a few percent of
+# themselves. The rule is checked after STEADY_MIN_BATCHES batches and
+# then every time the batches grow by a tenth.
+class SteadyState:
+    # @param precision - float:     Target relative half width of the intervals.
+    # @param floors - list[float]:  Absolute floor of the magnitude of each
+    #                               statistic's estimate (None for no floors).
+    def __init__(self, precision, floors=None):
+        self.precision = precision              # target relative half width of the intervals
+        self.floors = floors                    # floor of the estimate of every statistic
+        self.batches = []                       # (y, x) sums of every statistic of each batch
+        self.warmup = 0                         # number of batches of the warm-up
+        self.intervals = []                     # (estimate, half width) of every statistic
+        self.next_check = STEADY_MIN_BATCHES    # number of batches of the next check
+
+    # Add the next batch
+    # @param batch - list[(float, float)]:  The (y, x) sums of every statistic.
+    # @return bool:                         True if the run can stop.
+    def add(self, batch):
+        self.batches.append(batch)
+        if len(self.batches) < self.next_check:
+            return False
+        self.next_check = len(self.batches) + max(MSER_BATCH, len(self.batches) // 10)
+        return self.check()
+
+    # Find the warm-up and estimate the statistics after it
+    # Called by add(), and once more at the end of a run that was not stopped.
+    # @return bool: True if the run can stop.
+    def check(self):
+        ratios = [y / x if x else 0.0 for y, x in (batch[0] for batch in self.batches)]
+        self.warmup, ended = mser5(ratios)
+        kept = self.batches[self.warmup:]
+        n = len(kept)
+        g = min(STEADY_GROUPS, n)
+        groups = [kept[i * n // g:(i + 1) * n // g] for i in range(g)]
+
+        self.intervals = []
+        for k in range(len(kept[0]) if kept else 0):
+            y = sum(batch[k][0] for batch in kept)
+            x = sum(batch[k][1] for batch in kept)
+            samples = []
+            for group in groups:
+                x_group = sum(batch[k][1] for batch in group)
+                samples.append(sum(batch[k][0] for batch in group) / x_group if x_group else 0.0)
+            half_width = float('inf')
+            if g > 1:
+                mean = sum(samples) / g
+                variance = sum((sample - mean)**2 for sample in samples) / (g - 1)
+                half_width = t_quantile_95(g - 1) * math.sqrt(variance / g)
+            self.intervals.append((y / x if x else 0.0, half_width))
+        floors = self.floors or [0.0] * len(self.intervals)
+        return ended and all(half_width <= self.precision * max(abs(estimate), floor)
+                             for (estimate, half_width), floor in zip(self.intervals, floors))
@@ -0,0 +1,100 @@
+##########################################################################
+# Benchmarks for the M/M/1 and M/M/1/K simulators (ECE358 Lab 1)
+#
+# Times every engine of py_lab1.py over a grid of rho (including overload
+# for M/M/1/K) and simulation time T with the shared harness (see
+# bench.py), which records the wall time, events per second and RSS of
+# each case and compares them against a baseline.
+##########################################################################
+
+import contextlib
+import io
+import json
+import os
+import sys
+from collections import namedtuple
+
+import py_lab1
+
+# The benchmark harness shared by the labs lives in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import bench
+
+# Engines that simulate regenerative cycles without the event loop
+CYCLE_ENGINES = [py_lab1.ENGINE_REGENERATIVE, py_lab1.ENGINE_IMPORTANCE]
+
+# A single benchmark case. curve names the scaling curve the case belongs to.
+BenchCase = namedtuple('BenchCase', ['curve', 'engine', 'rho', 'K', 'T'])
+
+# Benchmark of the packet buffer simulators (see bench.Benchmark)
+class Lab1Benchmark(bench.Benchmark):
+    DESCRIPTION = 'Benchmark the packet buffer simulators (ECE358 Lab1)'
+    SUITES = {
+        'quick': 20,
+        'full': 1000,
+    }
+    BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+    COLUMNS = 'Curve,Engine,Rho,K,T'
+
+    # Build the cases of a suite
+    # Each engine gets a rho curve at the base T and a T curve at rho = 0.95.
+    # The M/M/1/K rho curve continues into overload. M/M/1 never regenerates
+    # past rho = 1, and deep in overload an M/M/1/K run is a single cycle, so
+    # the rho curves of the regenerative and importance engines stop at 1.5.
+    # @param base_time - int: Base simulation time of the suite.
+    # @return list[BenchCase]: The cases.
+    def build_cases(self, base_time):
+        times = sorted({max(1, base_time // 8), max(1, base_time // 4), max(1, base_time // 2), base_time})
+        infinite_engines = [py_lab1.ENGINE_EVENT, py_lab1.ENGINE_STREAMING, py_lab1.ENGINE_REGENERATIVE]
+        if py_lab1.np is not None:
+            infinite_engines.append(py_lab1.ENGINE_NUMPY)
+        finite_engines = [py_lab1.ENGINE_EVENT, py_lab1.ENGINE_STREAMING, py_lab1.ENGINE_REGENERATIVE,
+                          py_lab1.ENGINE_IMPORTANCE]
+
+        cases = []
+        for engine in infinite_engines:
+            for rho in [0.25, 0.5, 0.75, 0.95]:
+                cases.append(BenchCase('rho', engine, rho, None, base_time))
+            for sim_time in times:
+                cases.append(BenchCase('T', engine, 0.95, None, sim_time))
+        for engine in finite_engines:
+            for rho in [0.5, 0.95, 1.5] + ([5.0] if engine not in CYCLE_ENGINES else []):
+                cases.append(BenchCase('rho', engine, rho, 10, base_time))
+            for sim_time in times:
+                cases.append(BenchCase('T', engine, 0.95, 10, sim_time))
+        return cases
+
+    # Get the name of a case
+    # @param case - BenchCase: The case.
+    # @return str: Unique name of the case, used as its key in the baseline.
+    def name(self, case):
+        return '%s/%s/rho=%r/K=%r/T=%d' % (case.curve, case.engine, case.rho, case.K, case.T)
+
+    # Run a case once
+    # The events are the events the simulation processed, as counted by its
+    # profiler; the profiler only writes its final report (to a buffer), so
+    # it costs one call per event. The regenerative and importance engines
+    # simulate cycles without the event loop, so their events are the
+    # cycles (and busy periods) they simulated. Every case runs as a single
+    # segment, so it measures one process.
+    # @param case - BenchCase: The case to run.
+    # @return int: Number of events the simulation processed.
+    def run(self, case):
+        point = py_lab1.SweepPoint(case.rho, case.K, case.T, 0, bench.SEED, case.engine,
+                                   None, py_lab1.MAX_REPLICATIONS, float('inf'))
+        report = io.StringIO()
+        with contextlib.redirect_stderr(report):
+            results = py_lab1.run_sweep_point(point)
+        if case.engine in CYCLE_ENGINES:
+            return results[-1]
+        return json.loads(report.getvalue().splitlines()[-1])['events']
+
+# Run the benchmarks based on the command line options provided
+# Can call 'python bench_lab1.py --help' to view all options.
+def main():
+    bench.main(Lab1Benchmark())
+
+# END MAIN
+
+if __name__ == '__main__':
+   main()
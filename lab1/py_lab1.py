@@ -1,7 +1,19 @@
 import argparse
 import random
 import math
-import heapq
+import os
+import sys
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:     # NumPy is only required by the vectorized engine
+    np = None
+
+# The discrete-event kernel shared by the labs lives in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import des
 
 ####################################################
 ############### Event type constants ###############
@@ -9,6 +21,7 @@ import heapq
 ARRIVAL = 0
 DEPARTURE = 1
 OBSERVER = 2
+DROPPED = 3     # only appears in traces; an arrival that found the queue full
 
 ####################################################
 ############### Parameter Constants ################
@@ -17,14 +30,145 @@ L = 2000
 C = 1000000
 T = 1000
 
+####################################################
+############### Engine Constants ###################
+####################################################
+ENGINE_EVENT = 'event'      # event list simulation (default)
+ENGINE_NUMPY = 'numpy'      # vectorized Lindley recursion (M/M/1 only)
+ENGINE_STREAMING = 'streaming'  # lazy event sources, constant memory
+ENGINE_REGENERATIVE = 'regenerative'    # regenerative cycles simulated in parallel
+ENGINE_IMPORTANCE = 'importance'        # regenerative cycles, losses by importance sampling (M/M/1/K only)
+NP_BLOCK = 1 << 20          # number of variates drawn per NumPy block
+
+ESTIMATOR_OBSERVER = 'observer'  # sample the queue at Poisson observer events (default)
+ESTIMATOR_TIME = 'time'         # exact time-integrals of the queue length and idle time
+
+# Statistics of a regenerative cycle
+CYCLE_LENGTH = 0
+CYCLE_AREA = 1      # time-integral of the number of packets in queue
+CYCLE_IDLE = 2      # time the queue was empty
+CYCLE_ARRIVALS = 3
+CYCLE_DROPS = 4
+# Statistics estimated as ratios of cycle sums: E[N], P(IDLE), P(LOSS)
+CYCLE_RATIOS = [(CYCLE_AREA, CYCLE_LENGTH), (CYCLE_IDLE, CYCLE_LENGTH), (CYCLE_DROPS, CYCLE_ARRIVALS)]
+IMPORTANCE_SHARE = 0.5  # share of the simulated time spent on importance sampled busy periods
+
+engine = ENGINE_EVENT
+estimator = ESTIMATOR_OBSERVER
+segments = 1                    # number of parallel segments of a regenerative or importance run
+steady_state = None             # relative precision to stop runs at (None to run for T)
+# Pending event set of the event engine. It only ever holds the next arrival
+# and observation and the departures of the queued packets, and a heap beats
+# a calendar queue on so few events.
+scheduler = des.SCHEDULER_HEAP
+
+# A single point of a parameter sweep. K is None for the infinite buffer
+# and seed is None for an unseeded (non-reproducible) run. With a precision
+# the point is replicated until the confidence intervals are narrow enough.
+# With a profile interval the point is instrumented (see des.Profiler), and
+# with a trace path its events are recorded (see des.TraceWriter). The scheduler
+# is the event engine's pending event set (see des.Simulator) and the
+# estimator how E[N] and P(IDLE) are measured. The regenerative engine
+# splits the run into segments simulated in parallel. With a steady state
+# precision the warm-up is dropped and the run stops early once its
+# estimates are precise enough, T being the longest run.
+SweepPoint = namedtuple('SweepPoint', ['rho', 'K', 'T', 'replication', 'seed', 'engine',
+                                       'precision', 'max_replications', 'profile', 'trace',
+                                       'scheduler', 'estimator', 'segments', 'steady_state'],
+                        defaults=(None, None, des.SCHEDULER_HEAP, ESTIMATOR_OBSERVER, 1, None))
+
+####################################################
+############### Cache Constants ####################
+####################################################
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+CACHE_LIMIT = 64            # default size limit of the result cache [MB]
+
+####################################################
+############ Replication Constants #################
+####################################################
+MIN_REPLICATIONS = 5        # replications before the precision is first checked
+MAX_REPLICATIONS = 100      # default cap on the number of replications
+STEADY_BATCHES = 1000       # batches of a run of length T with the stopping rule (see des.SteadyState)
+PROBABILITY_FLOOR = 0.1     # probabilities below this are held to precision * PROBABILITY_FLOOR absolute
+STATISTIC_FLOORS = [0.0, PROBABILITY_FLOOR, PROBABILITY_FLOOR]  # floors of E[N], P(IDLE), P(LOSS)
+
+# Random streams
+# One independent random stream per purpose (arrivals, service, observers),
+# all derived from a single seed (see des.seeded_stream()).
+class RandomStreams:
+    def __init__(self, seed=None):
+        self.seed = seed                                        # seed of the streams (None for unseeded)
+        self.arrival = des.seeded_stream(seed, ('arrival',))    # packet inter-arrival times
+        self.service = des.seeded_stream(seed, ('service',))    # packet service times
+        self.observer = des.seeded_stream(seed, ('observer',))  # observer inter-event times
+
+    # Spawn independent substreams (see des.spawn_seed())
+    # @param index - int: Index of the substreams.
+    # @return RandomStreams: Streams seeded from this seed and the index.
+    def spawn(self, index):
+        return RandomStreams(des.spawn_seed(self.seed, index))
+
+# Random streams of the current simulation
+streams = RandomStreams()
+
+# Profiler of the current simulation (see des.Profiler). The simulators
+# only touch it through this module-level profiler, which is None unless
+# profiling is enabled, so the cost when it is off is one comparison per
+# event.
+profiler = None
+
+# Calculate statistics from a trace
+# E[N] and P(IDLE) are recomputed from the queue lengths at the observer
+# records, or, for traces without observers (see ESTIMATOR_TIME), as time
+# averages over [0, end_time] like the run itself: the queue starts empty,
+# each record's queue length holds until the next record, and records past
+# the end (the remaining departures) are left out. P(LOSS) is recomputed
+# from the arrival and dropped records. With a window, only the records in
+# it are used, and the time averages are over the window (clipped to the
+# run), starting from the queue length at its start.
+# @param trace - numpy.ndarray: Records of a trace.
+# @param end_time - float: Time the run was simulated up to.
+# @param window - (float, float): Start and end of the window (None for the
+#                                 whole run).
+# @return (float, float, float): A tuple of (E[N], P(IDLE), P(LOSS))
+def trace_statistics(trace, end_time, window=None):
+    times = trace['time']
+    start, end = 0.0, end_time
+    records = trace
+    if window is not None:
+        records = trace[(times >= window[0]) & (times < window[1])]
+        start, end = max(window[0], 0.0), min(window[1], end_time)
+
+    c_generated = np.count_nonzero(records['type'] == ARRIVAL) + np.count_nonzero(records['type'] == DROPPED)
+    c_dropped = np.count_nonzero(records['type'] == DROPPED)
+    p_loss = c_dropped / c_generated if c_generated else 0.0
+    observed = records['type'] == OBSERVER
+    if np.any(observed):
+        queue = records['queue'][observed]
+        return float(queue.mean()), float(np.count_nonzero(queue == 0) / queue.size), p_loss
+
+    first = np.searchsorted(times, start, side='right')
+    last = np.searchsorted(times, end, side='left')
+    initial = trace['queue'][first - 1] if first > 0 else 0
+    durations = np.diff(np.concatenate(([start], times[first:last], [end])))
+    queue = np.concatenate(([initial], trace['queue'][first:last]))
+    return (float((queue * durations).sum() / (end - start)),
+            float(durations[queue == 0].sum() / (end - start)), p_loss)
+
+# Trace writer of the current simulation (None when tracing is off). Its
+# records hold the queue length after each event; the node and collision
+# count do not apply in this lab and are -1.
+tracer = None
+
 # Generate exponential random variable
 # Generate a variable based on a Poisson distribution following:
 # var = -(1/lambda_para) * ln(1 - U)
 # @param lambda_para - float: Lambda parameter for random variable from
 #                           the equation mentioned above.
+# @param rng - VariateStream: Stream to draw from (default: global stream).
 # @return float: exponential random variable.
-def generate_random(lambda_para):
-    return - (1 / lambda_para) * math.log(1 - random.uniform(0, 1))
+def generate_random(lambda_para, rng=random):
+    return rng.expovariate(lambda_para)
 
 # Generate array of exponential random variables
 # Generate a list of length 1000 consisting of random variables following
@@ -42,187 +186,1002 @@ def generate_random_array(lambda_para):
 
     return expo_random_array
 
+# Generate Poisson process event times lazily
+# Yield exponentially spaced event times until the horizon T is passed,
+# including the first event time past T like the list-building loops do.
+# @param rate - float: Rate of the Poisson process.
+# @param rng - VariateStream: Stream to draw from.
+# @return generator[float]: Event times in increasing order.
+def generate_times(rate, rng):
+    expovariate = rng.expovariate
+    event_time = 0
+    while event_time < T:
+        event_time += expovariate(rate)
+        yield event_time
+
 # Simulate an M/M/1 queue
 # Simulate a queue/buffer with an infinite length that processes arrival,
 # departure, and observer event packets.
 # @param rho - float: Rho parameter for utilization of the queue.
 # @return (float, float): A tuple of (E[N], P(IDLE))
 def infinite_buffer(rho):
-    arrival_rate = (rho * C)/L          # get lambad based on traffic intensity
-    observer_rate = 5 * arrival_rate    # observer rate is at least 5 times of arrival rate
+    return finite_buffer(rho, None)[:2]
 
-    packet_arrival_time = 0             # initialize arrival time of first packet
-    departure_time = 0                  # initialize departure time of first packet
-    observer_time = 0                   # initialize observer time of first observation event
+# Generate Poisson process event times with NumPy
+# Draw exponential inter-event times in blocks and accumulate them until the
+# horizon is passed. As with the arrivals and observers of infinite_buffer(),
+# the first event time past the horizon is kept.
+# @param rng - numpy.random.Generator: Source of the random variates.
+# @param rate - float: Rate of the Poisson process.
+# @param horizon - float: Time to generate events up to.
+# @return numpy.ndarray: Sorted event times.
+def generate_times_numpy(rng, rate, horizon):
+    blocks = []
+    last = 0.0
+    while last < horizon:
+        block = last + np.cumsum(rng.exponential(1 / rate, NP_BLOCK))
+        blocks.append(block)
+        last = block[-1]
+    times = np.concatenate(blocks)
+    return times[:np.searchsorted(times, horizon, side='left') + 1]
 
-    arrival_array = []                  # arrrival event list
-    departure_array = []                # departure event list
-    observer_array = []                 # observer event list
-    event_array = []                    # event list of all three different events
-    packets_in_queue = []               # array to store number of packets in the queue at differnt observation time
-
-    # Generate observer array, arrival array, and departure array 
-    while packet_arrival_time < T:
-        packet_arrival_time += generate_random(arrival_rate)
-        arrival_array.append(packet_arrival_time)
-        service_time = (generate_random(1/L))/C
-        if packet_arrival_time > departure_time:
-            departure_time = packet_arrival_time + service_time
-        else: 
-            departure_time+=service_time
-
-        departure_array.append(departure_time)
+# Simulate an M/M/1 queue (vectorized)
+# Same model as infinite_buffer(), but without an event list. Departure
+# times follow the Lindley recursion d[i] = max(a[i], d[i-1]) + s[i], which
+# with S = cumsum(s) becomes d = S + running_max(a - S + s). The number of
+# packets in the queue at an observer instant is then the number of
+# arrivals minus the number of departures before it, both found with
+# searchsorted since the two arrays are sorted. With the time estimator,
+# the time-integral of the queue length is the total time the packets spend
+# in the system and the busy time the total service time, both clipped to
+# [0, T].
+# @param rho - float: Rho parameter for utilization of the queue.
+# @return (float, float): A tuple of (E[N], P(IDLE))
+def infinite_buffer_numpy(rho):
+    arrival_rate = (rho * C)/L          # get lambad based on traffic intensity
+    observer_rate = 5 * arrival_rate    # observer rate is at least 5 times of arrival rate
+    prof = profiler
 
-    while observer_time < T:
-        observer_time += generate_random(observer_rate)
-        observer_array.append(observer_time)
-
-    # Generate Event array
-    for arrival in arrival_array:
-        event_array.append((arrival, ARRIVAL))
-    
-    for departure in departure_array:
-        event_array.append((departure, DEPARTURE))
-    
-    for observer in observer_array:
-        event_array.append((observer, OBSERVER))
-    
-    event_array.sort(key=lambda x: x[0])
+    if prof is not None:
+        prof.phase('arrivals')
+    arrival_array = generate_times_numpy(np.random.default_rng(streams.arrival.getrandbits(64)),
+                                         arrival_rate, T)
+    service_array = np.random.default_rng(streams.service.getrandbits(64)).exponential(L / C, arrival_array.size)
+    if prof is not None:
+        prof.phase('departures')
+        prof.ticks += 2 * arrival_array.size
+    service_sum = np.cumsum(service_array)
+    departure_array = service_sum + np.maximum.accumulate(arrival_array - service_sum + service_array)
+    del service_sum
 
-    # Begin simulation
+    if estimator == ESTIMATOR_TIME:
+        end_array = np.minimum(departure_array, T)
+        s_area = float((end_array - np.minimum(arrival_array, T)).sum())
+        s_busy = float((end_array - np.minimum(departure_array - service_array, T)).sum())
+        if prof is not None:
+            prof.phase(None)
+            prof.count('arrival', arrival_array.size)
+            prof.count('departure', departure_array.size)
+        return s_area / T, (T - s_busy) / T
+    del service_array
 
-    # Counters
-    c_arrival = 0           # number of arrived packets
-    c_departure = 0         # number of departured packets
+    # Observe in blocks so the observer stream is never held in memory at once
+    if prof is not None:
+        prof.phase('observe')
     c_observation = 0       # number of observations
     c_idle = 0              # number of idle status when observe
+    s_packets = 0           # sum of number of packets in the queue over all observations
+    observer_rng = np.random.default_rng(streams.observer.getrandbits(64))
+    observer_time = 0.0
+    while observer_time < T:
+        observer_array = observer_time + np.cumsum(observer_rng.exponential(1 / observer_rate, NP_BLOCK))
+        observer_time = observer_array[-1]
+        if observer_time >= T:
+            observer_array = observer_array[:np.searchsorted(observer_array, T, side='left') + 1]
 
-    for event in event_array:
-        # print(event)
-        if event[1] == ARRIVAL:
-            c_arrival+=1
-        elif event[1] == DEPARTURE:
-            c_departure+=1
-        elif event[1] == OBSERVER:
-            c_observation+=1
-            packets_in_queue.append(c_arrival-c_departure)
-            # If all packets that arrived have departed, then queue is empty
-            if c_arrival == c_departure:
-                c_idle+=1
-    
-    average_pkts_in_queue = sum(packets_in_queue) / len(packets_in_queue)
-    p_idle = c_idle/c_observation
+        packets_in_queue = (np.searchsorted(arrival_array, observer_array, side='right')
+                            - np.searchsorted(departure_array, observer_array, side='right'))
+        c_observation += observer_array.size
+        c_idle += int(np.count_nonzero(packets_in_queue == 0))
+        s_packets += int(packets_in_queue.sum())
+
+        if prof is not None:
+            prof.ticks += observer_array.size - 1
+            prof.tick(float(observer_array[-1]))
 
-    return average_pkts_in_queue, p_idle
+    if prof is not None:
+        prof.phase(None)
+        prof.count('arrival', arrival_array.size)
+        prof.count('departure', departure_array.size)
+        prof.count('observer', c_observation)
+    return s_packets / c_observation, c_idle / c_observation
 
 # Simulate an M/M/1/K queue
 # Simulate a queue/buffer with length K that processes arrival,
-# departure, and observer event packets.
+# departure, and observer event packets. The events are processed by the
+# discrete-event kernel: every arrival schedules the next arrival and its
+# departure, and every observation the next observation, so only the
+# pending events are held. Simultaneous events are processed in the order
+# arrival, departure, observer. With the time estimator there are no
+# observers; instead the time-integrals of the queue length and idle time
+# over [0, T] are accumulated at every arrival and departure.
+# With a steady state precision, the run is simulated in STEADY_BATCHES
+# batches of length T/STEADY_BATCHES and stopped by des.SteadyState, and
+# the statistics are those of the batches after the warm-up.
 # @param rho - float: Rho parameter for utilization of the queue.
-# @param K - int: K parameter for length of the queue/buffer.
-# @return (float, float, float): A tuple of (E[N], P(IDLE), P(LOSS))
+# @param K - int: K parameter for length of the queue/buffer (None for an
+#                 infinite buffer).
+# @return (float, float, float): A tuple of (E[N], P(IDLE), P(LOSS)); with a
+#         steady state precision, the (estimate, half width) of E[N], P(IDLE)
+#         and, for a finite buffer, P(LOSS), then the warm-up and run length.
 def finite_buffer(rho, K):
     arrival_rate = (rho * C)/L              # get lambad based on traffic intensity
     observer_rate = 5 * arrival_rate        # observer rate is at least 5 times of arrival rate
+    arrival_stream = streams.arrival
+    service_stream = streams.service
+    observer_stream = streams.observer
+    prof = profiler
+    tr = tracer
+    sim = des.Simulator(scheduler)
+    time_average = estimator == ESTIMATOR_TIME
 
-    packet_arrival_time = 0                 # initialize arrival time of first packet
-    observer_time = 0                       # initialize observer time of first observation event
+    # Counters
+    c_arrival = 0           # number of packets that successfully enter the queue
+    c_departure = 0         # number of packets departured from the queue
+    c_observation = 0       # number of obervation points
+    c_idle = 0              # number of idle cases occurred at observation point
+    c_generated = 0         # number of all generated packets
+    c_dropped = 0           # number of packets that are dropped
+    s_packets = 0           # sum of number of packets in queue over all observations
+    s_area = 0.0            # time-integral of the number of packets in queue
+    s_idle = 0.0            # time the queue was empty
+    t_last = 0.0            # time up to which the integrals are accumulated
 
-    event_array = []                        # event list of all three different events
-    packets_in_queue = []                   # array to store number of packets in the queue at differnt observation time
+    queue = 0               # the current number of packets in queue
+    departure_time = 0      # initiallize the departure time of the first packet
 
-    # Generate arrival and observer events
-    while packet_arrival_time < T:
-        packet_arrival_time += generate_random(arrival_rate)
-        heapq.heappush(event_array, (packet_arrival_time, ARRIVAL))
+    # Accumulate the time-integrals up to a time (at most T), before the
+    # number of packets in queue changes
+    # @param t - float: Time of the change.
+    def integrate(t):
+        nonlocal s_area, s_idle, t_last
+        t = min(t, T)
+        s_area += queue * (t - t_last)
+        if queue == 0:
+            s_idle += t - t_last
+        t_last = t
 
-    while observer_time < T:
-        observer_time += generate_random(observer_rate)
-        heapq.heappush(event_array, (observer_time, OBSERVER))
+    # A packet arrives; it either enters the queue and gets its departure
+    # scheduled, or is dropped if the queue is full
+    def arrive(event):
+        nonlocal c_generated, c_dropped, c_arrival, queue, departure_time
+        packet_arrival_time = event[0]
+        c_generated+=1
+        # If queue is full, then drop the newly-arrived event
+        if K is not None and queue >= K:
+            c_dropped+=1
+            if tr is not None:
+                tr.record(packet_arrival_time, DROPPED, -1, queue, -1)
+        # Otherwise, calculate appropriate departure time and schedule the departure
+        else:
+            if time_average:
+                integrate(packet_arrival_time)
+            c_arrival+=1
+            queue+=1
+
+            service_time = (generate_random(1/L, service_stream))/C
+            if packet_arrival_time > departure_time:
+                departure_time = packet_arrival_time + service_time
+            else:
+                departure_time+=service_time
+
+            sim.schedule(departure_time, DEPARTURE)
+            if tr is not None:
+                tr.record(packet_arrival_time, ARRIVAL, -1, queue, -1)
+        # Arrivals continue until the first one past T
+        if packet_arrival_time < T:
+            sim.schedule(packet_arrival_time + generate_random(arrival_rate, arrival_stream), ARRIVAL)
+
+    # A packet leaves the queue
+    def depart(event):
+        nonlocal c_departure, queue
+        if time_average:
+            integrate(event[0])
+        c_departure+=1
+        queue-=1
+        if tr is not None:
+            tr.record(event[0], DEPARTURE, -1, queue, -1)
+
+    # The number of packets in the queue is observed
+    def observe(event):
+        nonlocal c_observation, c_idle, s_packets
+        c_observation+=1
+        s_packets += queue
+        # If all packets that arrived have departed, then queue is empty
+        if queue == 0:
+            c_idle+=1
+        if tr is not None:
+            tr.record(event[0], OBSERVER, -1, queue, -1)
+        # Observations continue until the first one past T
+        if event[0] < T:
+            sim.schedule(event[0] + generate_random(observer_rate, observer_stream), OBSERVER)
 
     # Begin simulation
+    if prof is not None:
+        prof.phase('simulate')
+    sim.schedule(generate_random(arrival_rate, arrival_stream), ARRIVAL)
+    if not time_average:
+        sim.schedule(generate_random(observer_rate, observer_stream), OBSERVER)
+    steady = None
+    if steady_state is not None:
+        steady = steady_buffer(sim, [arrive, depart, observe], K,
+                               lambda: (s_area, s_idle, s_packets, c_observation, c_idle, c_dropped, c_generated),
+                               integrate if time_average else None)
+    else:
+        sim.run([arrive, depart, observe], profiler=prof)
+
+    if prof is not None:
+        prof.phase(None)
+        prof.count('arrival', c_generated)
+        prof.count('departure', c_departure)
+        prof.count('observer', c_observation)
+        if K is not None:
+            prof.count('dropped', c_dropped)
+
+    if steady is not None:
+        return steady
+    if time_average:
+        integrate(T)
+        return s_area / T, s_idle / T, c_dropped / c_generated
+    return s_packets / c_observation, c_idle / c_observation, c_dropped / c_generated
+
+# Run an M/M/1/K queue model in batches until its steady state is known
+# The model of finite_buffer() is run one batch of length T/STEADY_BATCHES
+# at a time, and the differences of its counters over each batch are fed to
+# the stopping rule (see des.SteadyState), with E[N] first, so the warm-up
+# is found on the queue length. P(IDLE) and P(LOSS) get the absolute floor
+# PROBABILITY_FLOOR, since they can be orders of magnitude below 1 (e.g.
+# P(IDLE) in overload, P(LOSS) at a low rho).
+# @param sim - des.Simulator: Simulator with the model's first events scheduled.
+# @param handlers - list[function]: Handlers of the model's events.
+# @param K - int: K parameter for length of the queue/buffer (None for an
+#                 infinite buffer).
+# @param counters - function: Returns the model's running sums and counts
+#                   (s_area, s_idle, s_packets, c_observation, c_idle,
+#                   c_dropped, c_generated).
+# @param integrate - function: Accumulates the time-integrals up to a time
+#                    (None for the observer estimator).
+# @return tuple[float]: The (estimate, half width) of E[N], P(IDLE) and, for
+#                       a finite buffer, P(LOSS), then the warm-up and run length.
+def steady_buffer(sim, handlers, K, counters, integrate):
+    rule = des.SteadyState(steady_state, STATISTIC_FLOORS)
+    batch_time = T / STEADY_BATCHES
+    previous = counters()
+    stopped = False
+    for index in range(1, STEADY_BATCHES + 1):
+        t_end = index * batch_time
+        sim.run(handlers, until=t_end, profiler=profiler)
+        if integrate is not None:
+            integrate(t_end)
+        current = counters()
+        s_area, s_idle, s_packets, c_observation, c_idle, c_dropped, c_generated = \
+            [b - a for a, b in zip(previous, current)]
+        previous = current
+        if integrate is not None:
+            batch = [(s_area, batch_time), (s_idle, batch_time)]
+        else:
+            batch = [(s_packets, c_observation), (c_idle, c_observation)]
+        if K is not None:
+            batch.append((c_dropped, c_generated))
+        if rule.add(batch):
+            stopped = True
+            break
+    if not stopped:
+        rule.check()
+
+    return tuple(value for interval in rule.intervals for value in interval) + \
+        (rule.warmup * batch_time, len(rule.batches) * batch_time)
+
+# Simulate an M/M/1/K queue (streaming)
+# Same model as finite_buffer(), but arrival and observer events are drawn
+# lazily from generators instead of being pushed into a heap up front, and
+# observations are folded into running sums. Departures of a FIFO queue are
+# in increasing order, so the pending ones are kept in a deque that never
+# holds more than K entries. Memory use therefore does not depend on T.
+# Ties are resolved in the same order as the event list of finite_buffer():
+# arrival, then departure, then observer. The time estimator also works as
+# in finite_buffer().
+# @param rho - float: Rho parameter for utilization of the queue.
+# @param K - int: K parameter for length of the queue/buffer (None for an
+#                 infinite buffer).
+# @return (float, float, float): A tuple of (E[N], P(IDLE), P(LOSS))
+def finite_buffer_streaming(rho, K):
+    arrival_rate = (rho * C)/L              # get lambad based on traffic intensity
+    observer_rate = 5 * arrival_rate        # observer rate is at least 5 times of arrival rate
+
+    arrivals = generate_times(arrival_rate, streams.arrival)
+    time_average = estimator == ESTIMATOR_TIME
+    observers = iter(()) if time_average else generate_times(observer_rate, streams.observer)
+    departures = deque()                    # pending departure times, at most K of them
+    prof = profiler
+    tr = tracer
 
     # Counters
-    c_arrival = 0           # number of packets that successfully enter the queue
-    c_departure = 0         # number of packets departured from the queue
     c_observation = 0       # number of obervation points
     c_idle = 0              # number of idle cases occurred at observation point
     c_generated = 0         # number of all generated packets
     c_dropped = 0           # number of packets that are dropped
+    s_packets = 0           # sum of number of packets in queue over all observations
+    s_area = 0.0            # time-integral of the number of packets in queue
+    s_idle = 0.0            # time the queue was empty
+    t_last = 0.0            # time up to which the integrals are accumulated
 
-    queue = 0               # the current number of packets in queue
-    departure_time = 0      # initiallize the departure time of the first packet    
+    departure_time = 0      # initiallize the departure time of the first packet
+    next_arrival = next(arrivals)
+    next_observer = next(observers, None)
+    c_departure = 0         # number of packets departured from the queue
 
-    while len(event_array) > 0:
-        # print(len(event_array))
-        event = heapq.heappop(event_array)
-        if event[1] == ARRIVAL:
+    if prof is not None:
+        prof.phase('simulate')
+    while next_arrival is not None or next_observer is not None:
+        if prof is not None:
+            prof.tick(min(t for t in (next_arrival, next_observer) if t is not None))
+        if next_arrival is not None and (next_observer is None or next_arrival <= next_observer) \
+                and (not departures or next_arrival <= departures[0]):
             c_generated+=1
-            packet_arrival_time = event[0]
             # If queue is full, then drop the newly-arrived event
-            if queue >= K:
+            if K is not None and len(departures) >= K:
                 c_dropped+=1
-            # Otherwise, calculate appropriate departure time and departure event add to list
+                if tr is not None:
+                    tr.record(next_arrival, DROPPED, -1, len(departures), -1)
+            # Otherwise, calculate appropriate departure time and queue the departure
             else:
-                c_arrival+=1
-                queue+=1 
-
-                service_time = (generate_random(1/L))/C
-                if packet_arrival_time > departure_time:
-                    departure_time = packet_arrival_time + service_time
-                else: 
+                if time_average:
+                    t = min(next_arrival, T)
+                    s_area += len(departures) * (t - t_last)
+                    if not departures:
+                        s_idle += t - t_last
+                    t_last = t
+                service_time = (generate_random(1/L, streams.service))/C
+                if next_arrival > departure_time:
+                    departure_time = next_arrival + service_time
+                else:
                     departure_time+=service_time
-                
-                heapq.heappush(event_array, (departure_time, DEPARTURE))
+                departures.append(departure_time)
+                if tr is not None:
+                    tr.record(next_arrival, ARRIVAL, -1, len(departures), -1)
+            next_arrival = next(arrivals, None)
 
-        elif event[1] == DEPARTURE:
+        elif departures and (next_observer is None or departures[0] <= next_observer):
+            if time_average:
+                t = min(departures[0], T)
+                s_area += len(departures) * (t - t_last)
+                t_last = t
+            departure = departures.popleft()
             c_departure+=1
-            queue-=1
-        elif event[1] == OBSERVER:
+            if tr is not None:
+                tr.record(departure, DEPARTURE, -1, len(departures), -1)
+
+        else:
             c_observation+=1
-            packets_in_queue.append(c_arrival-c_departure)
+            s_packets += len(departures)
             # If all packets that arrived have departed, then queue is empty
-            if c_arrival == c_departure:
+            if not departures:
                 c_idle+=1
-    
-    average_pkts_in_queue = sum(packets_in_queue) / len(packets_in_queue)
-    p_idle = c_idle/c_observation
+            if tr is not None:
+                tr.record(next_observer, OBSERVER, -1, len(departures), -1)
+            next_observer = next(observers, None)
+
+    if prof is not None:
+        prof.phase(None)
+        prof.count('arrival', c_generated)
+        prof.count('departure', c_departure)
+        prof.count('observer', c_observation)
+        prof.count('dropped', c_dropped)
+
+    if time_average:
+        if not departures:
+            s_idle += T - t_last
+        s_area += len(departures) * (T - t_last)
+        return s_area / T, s_idle / T, c_dropped / c_generated
+    return s_packets / c_observation, c_idle / c_observation, c_dropped / c_generated
+
+# Simulate regenerative cycles of an M/M/1/K queue
+# The queue regenerates whenever a packet arrives to an empty queue: from
+# then on the future does not depend on the past, so the stretches between
+# such arrivals (cycles) are independent and identically distributed. The
+# simulation starts with an arrival to the empty queue and runs whole
+# cycles until the first regeneration at or past the horizon. Only the sums
+# of the cycle statistics and of the squares and products needed by the
+# ratio estimator (see CYCLE_RATIOS) are kept, so results of segments can
+# be merged by adding them up. The infinite buffer only regenerates for
+# rho < 1; past that its first cycle never ends.
+# @param rho - float: Rho parameter for utilization of the queue (below 1
+#                     for an infinite buffer).
+# @param K - int: K parameter for length of the queue/buffer (None for an
+#                 infinite buffer).
+# @param horizon - float: Time to simulate cycles up to.
+# @return (int, list[float], list[list[float]]): A tuple of (number of
+#         cycles, sum of each statistic, sums of (y*y, y*x, x*x) of each ratio)
+def simulate_cycles(rho, K, horizon):
+    arrival_rate = (rho * C)/L              # get lambad based on traffic intensity
+    arrival_stream = streams.arrival
+    service_stream = streams.service
+    departures = deque()                    # pending departure times
+
+    c_cycles = 0            # number of completed cycles
+    sums = [0.0] * 5        # sum of each cycle statistic over the cycles
+    moments = [[0.0, 0.0, 0.0] for _ in CYCLE_RATIOS]
+
+    cycle_start = 0.0       # time the current cycle started
+    s_area = 0.0            # time-integral of the number of packets in queue in the cycle
+    s_idle = 0.0            # time the queue was empty in the cycle
+    c_arrival = 0           # number of packets that arrived in the cycle
+    c_dropped = 0           # number of packets dropped in the cycle
+    t_last = 0.0            # time up to which the integrals are accumulated
+    departure_time = 0      # initiallize the departure time of the first packet
+    next_arrival = 0.0      # the first arrival starts the first cycle
+
+    while True:
+        if departures and departures[0] <= next_arrival:
+            departure = departures.popleft()
+            s_area += (len(departures) + 1) * (departure - t_last)
+            t_last = departure
+            continue
+
+        # An arrival to the empty queue ends the current cycle and starts the next
+        if not departures:
+            s_idle += next_arrival - t_last
+            if c_arrival > 0:
+                cycle = (next_arrival - cycle_start, s_area, s_idle, c_arrival, c_dropped)
+                c_cycles += 1
+                for i in range(5):
+                    sums[i] += cycle[i]
+                for moment, (y, x) in zip(moments, CYCLE_RATIOS):
+                    moment[0] += cycle[y] * cycle[y]
+                    moment[1] += cycle[y] * cycle[x]
+                    moment[2] += cycle[x] * cycle[x]
+                if next_arrival >= horizon:
+                    return c_cycles, sums, moments
+                cycle_start = next_arrival
+                s_area = s_idle = 0.0
+                c_arrival = c_dropped = 0
+        else:
+            s_area += len(departures) * (next_arrival - t_last)
+        t_last = next_arrival
+
+        c_arrival+=1
+        # If queue is full, then drop the newly-arrived event
+        if K is not None and len(departures) >= K:
+            c_dropped+=1
+        else:
+            service_time = (generate_random(1/L, service_stream))/C
+            if next_arrival > departure_time:
+                departure_time = next_arrival + service_time
+            else:
+                departure_time+=service_time
+            departures.append(departure_time)
+        next_arrival += generate_random(arrival_rate, arrival_stream)
+
+# Simulate one segment of a regenerative run
+# Runs in a worker process with the segment's own streams.
+# @param segment - (float, int, float, int): A tuple of (rho, K, horizon,
+#                  seed) of the segment.
+# @return tuple: Cycle sums of the segment (see simulate_cycles()).
+def run_cycle_segment(segment):
+    global streams
+    rho, K, horizon, seed = segment
+    streams = RandomStreams(seed)
+    return simulate_cycles(rho, K, horizon)
+
+# Calculate a regenerative ratio estimate and its 95% confidence interval
+# The estimate of E[Y]/E[X] over n cycles is r = sum(Y)/sum(X); its
+# variance follows from the sample variance of Z = Y - r*X, which is
+# computed from the sums of Y*Y, Y*X and X*X (sum(Z) is zero).
+# @param c_cycles - int: Number of cycles.
+# @param s_y - float: Sum of the numerator statistic.
+# @param s_x - float: Sum of the denominator statistic.
+# @param moment - list[float]: Sums of Y*Y, Y*X and X*X.
+# @return (float, float): A tuple of (ratio, half width of the interval)
+def ratio_interval(c_cycles, s_y, s_x, moment):
+    ratio = s_y / s_x
+    if c_cycles < 2:
+        return ratio, float('inf')
+    variance = max(moment[0] - 2 * ratio * moment[1] + ratio * ratio * moment[2], 0.0) / (c_cycles - 1)
+    return ratio, des.t_quantile_95(c_cycles - 1) * math.sqrt(variance / c_cycles) / (s_x / c_cycles)
+
+# Simulate importance sampled busy periods of an M/M/1/K queue
+# Packets are only lost in busy periods that fill the queue, which is rare
+# for a large K at a low rho. Every busy period therefore starts from one
+# packet with the arrival and service rates swapped, so the queue drifts up
+# instead of down, until it either fills or empties. Once full, it goes on
+# with the true rates until it is empty, counting the packets dropped on the
+# way. Each arrival with the swapped rates multiplies the likelihood ratio
+# of the path by rho and each departure by 1/rho (the holding times keep
+# their distribution, as the total rate is unchanged), so the drops weighted
+# by the likelihood ratio are an unbiased estimate of the drops per cycle of
+# the true queue. Losses are not rare for rho >= 1 and the rates are then
+# left as they are.
+# @param rho - float: Rho parameter for utilization of the queue.
+# @param K - int: K parameter for length of the queue/buffer.
+# @param horizon - float: Time to simulate busy periods for.
+# @return (int, float, float): A tuple of (number of busy periods, sum of
+#                              the weighted drops, sum of their squares)
+def simulate_tilted_cycles(rho, K, horizon):
+    arrival_rate = (rho * C)/L              # get lambad based on traffic intensity
+    service_rate = C/L
+    arrival_stream = streams.arrival
+    service_stream = streams.service
+
+    c_cycles = 0            # number of busy periods
+    s_drops = 0.0           # sum of the weighted drops of the busy periods
+    s_squares = 0.0         # sum of the squared weighted drops
+    t = 0.0                 # time simulated so far
+
+    while t < horizon:
+        queue_length = 1    # the arrival to the empty queue starting the busy period
+        tilted = rho < 1
+        weight = 1.0        # likelihood ratio of the path while tilted
+        c_dropped = 0
+        while queue_length > 0:
+            # Go on with the true rates once the queue is full
+            if queue_length >= K:
+                tilted = False
+            if tilted:
+                next_arrival = generate_random(service_rate, arrival_stream)
+                next_departure = generate_random(arrival_rate, service_stream)
+            else:
+                next_arrival = generate_random(arrival_rate, arrival_stream)
+                next_departure = generate_random(service_rate, service_stream)
+
+            if next_arrival < next_departure:
+                t += next_arrival
+                if queue_length >= K:
+                    c_dropped+=1
+                else:
+                    queue_length+=1
+                if tilted:
+                    weight *= rho
+            else:
+                t += next_departure
+                queue_length-=1
+                if tilted:
+                    weight /= rho
+
+        c_cycles += 1
+        s_drops += weight * c_dropped
+        s_squares += (weight * c_dropped)**2
+    return c_cycles, s_drops, s_squares
+
+# Simulate one segment of an importance run
+# Runs in a worker process with the segment's own streams, spending
+# IMPORTANCE_SHARE of the segment on importance sampled busy periods and
+# the rest on regenerative cycles.
+# @param segment - (float, int, float, int): A tuple of (rho, K, horizon,
+#                  seed) of the segment.
+# @return (tuple, tuple): Cycle sums of the segment (see simulate_cycles())
+#                         and of its busy periods (see simulate_tilted_cycles()).
+def run_importance_segment(segment):
+    global streams
+    rho, K, horizon, seed = segment
+    streams = RandomStreams(seed)
+    cycles = simulate_cycles(rho, K, horizon * (1 - IMPORTANCE_SHARE))
+    return cycles, simulate_tilted_cycles(rho, K, horizon * IMPORTANCE_SHARE)
 
-    return average_pkts_in_queue, p_idle, c_dropped/c_generated
+# Simulate the segments of a run in parallel
+# One run of length T is cut into one segment of length T/segments per
+# worker process, each with its own substreams.
+# @param run - function: Simulates one segment (e.g. run_cycle_segment()).
+# @param rho - float: Rho parameter for utilization of the queue.
+# @param K - int: K parameter for length of the queue/buffer (None for an
+#                 infinite buffer).
+# @return list: Results of the segments.
+def run_segments(run, rho, K):
+    jobs = [(rho, K, T / segments, streams.spawn(index).seed) for index in range(segments)]
+    if segments == 1:
+        return [run(jobs[0])]
+    with ProcessPoolExecutor(max_workers=segments) as executor:
+        return list(executor.map(run, jobs))
+
+# Merge the cycle sums of segments
+# @param results - list[tuple]: Cycle sums of each segment (see simulate_cycles()).
+# @return tuple: Cycle sums of all segments.
+def merge_cycles(results):
+    c_cycles = sum(result[0] for result in results)
+    sums = [sum(result[1][i] for result in results) for i in range(5)]
+    moments = [[sum(result[2][j][i] for result in results) for i in range(3)]
+               for j in range(len(CYCLE_RATIOS))]
+    return c_cycles, sums, moments
+
+# Calculate the relative variance of a sample mean
+# @param count - int: Number of samples.
+# @param s_x - float: Sum of the samples.
+# @param s_xx - float: Sum of the squared samples.
+# @return float: Variance of the mean over the squared mean (infinite for
+#                fewer than two samples or a zero mean).
+def relative_variance(count, s_x, s_xx):
+    if count < 2 or s_x == 0:
+        return float('inf')
+    mean = s_x / count
+    return max(s_xx / count - mean * mean, 0.0) / (count - 1) / (mean * mean)
+
+# Simulate an M/M/1/K queue from regenerative cycles in parallel
+# The segments of the run (see run_segments()) simulate independent cycles
+# (see simulate_cycles()), and the merged cycle sums give E[N], P(IDLE) and
+# P(LOSS) as ratio estimates with confidence intervals. E[N] and P(IDLE)
+# are always exact time averages (see ESTIMATOR_TIME). The infinite buffer
+# only regenerates for rho < 1; past that its first cycle would never end,
+# so such a point is rejected.
+# @param rho - float: Rho parameter for utilization of the queue.
+# @param K - int: K parameter for length of the queue/buffer (None for an
+#                 infinite buffer).
+# @return tuple[float]: The (estimate, half width) of E[N], P(IDLE) and,
+#                       for a finite buffer, P(LOSS), then the number of cycles.
+def regenerative_buffer(rho, K):
+    if K is None and rho >= 1:
+        raise ValueError('the infinite buffer never regenerates at rho = %r >= 1' % rho)
+    c_cycles, sums, moments = merge_cycles(run_segments(run_cycle_segment, rho, K))
+    ratios = CYCLE_RATIOS if K is not None else CYCLE_RATIOS[:2]
+    intervals = [ratio_interval(c_cycles, sums[y], sums[x], moment)
+                 for (y, x), moment in zip(ratios, moments)]
+    return tuple(value for interval in intervals for value in interval) + (c_cycles,)
+
+# Simulate an M/M/1/K queue with importance sampling of the losses
+# For P(LOSS) around 1e-6 a plain run of any practical length sees no drops
+# at all. Each segment of the run (see run_segments()) instead splits its
+# time between regenerative cycles, which give E[N] and P(IDLE) as in
+# regenerative_buffer() and the mean number of arrivals per cycle, and
+# importance sampled busy periods, which give the mean number of drops per
+# cycle (see simulate_tilted_cycles()). P(LOSS) is their ratio; as the two
+# means are independent, its relative error is the root of the sum of
+# their relative variances.
+# @param rho - float: Rho parameter for utilization of the queue.
+# @param K - int: K parameter for length of the queue/buffer.
+# @return tuple[float]: The (estimate, half width) of E[N], P(IDLE) and
+#                       P(LOSS), the relative error of P(LOSS), then the
+#                       number of cycles and busy periods.
+def importance_buffer(rho, K):
+    results = run_segments(run_importance_segment, rho, K)
+    c_cycles, sums, moments = merge_cycles([result[0] for result in results])
+    c_tilted = sum(result[1][0] for result in results)
+    s_drops = sum(result[1][1] for result in results)
+    s_squares = sum(result[1][2] for result in results)
+
+    intervals = [ratio_interval(c_cycles, sums[y], sums[x], moment)
+                 for (y, x), moment in zip(CYCLE_RATIOS[:2], moments)]
+    loss = (s_drops / c_tilted) / (sums[CYCLE_ARRIVALS] / c_cycles)
+    # The sum of the squared arrivals per cycle is kept for the P(LOSS) ratio
+    relative_error = math.sqrt(relative_variance(c_tilted, s_drops, s_squares) +
+                               relative_variance(c_cycles, sums[CYCLE_ARRIVALS], moments[2][2]))
+    half_width = float('inf')
+    if relative_error < float('inf'):
+        half_width = des.t_quantile_95(min(c_cycles, c_tilted) - 1) * relative_error * loss
+    intervals.append((loss, half_width))
+    return tuple(value for interval in intervals for value in interval) + \
+        (relative_error, c_cycles + c_tilted)
+
+# Invoke the infinite_buffer() simulator with the selected engine
+# @param rho - float: Rho parameter for utilization of the queue.
+# @return (float, float): A tuple of (E[N], P(IDLE))
+def run_infinite(rho):
+    if engine == ENGINE_REGENERATIVE:
+        return regenerative_buffer(rho, None)
+    if engine == ENGINE_NUMPY:
+        return infinite_buffer_numpy(rho)
+    if engine == ENGINE_STREAMING:
+        return finite_buffer_streaming(rho, None)[:2]
+    if steady_state is not None:
+        return finite_buffer(rho, None)
+    return infinite_buffer(rho)
+
+# Invoke the finite_buffer() simulator with the selected engine
+# @param rho - float: Rho parameter for utilization of the queue.
+# @param K - int: K parameter for length of the queue/buffer.
+# @return (float, float, float): A tuple of (E[N], P(IDLE), P(LOSS))
+def run_finite(rho, K):
+    if engine == ENGINE_REGENERATIVE:
+        return regenerative_buffer(rho, K)
+    if engine == ENGINE_IMPORTANCE:
+        return importance_buffer(rho, K)
+    if engine == ENGINE_STREAMING:
+        return finite_buffer_streaming(rho, K)
+    return finite_buffer(rho, K)
+
+# Format one line of the CSV output
+# @param rho - float: Rho value of the simulation.
+# @param results - tuple[float]: Statistics returned by the simulator.
+# @return str: Comma separated row.
+def format_row(rho, results):
+    return ",".join(str(value) for value in (rho,) + tuple(results))
+
+# Calculate a 95% confidence interval
+# @param samples - list[float]: Independent samples of a statistic.
+# @return (float, float): A tuple of (mean, half width of the interval)
+def confidence_interval(samples):
+    n = len(samples)
+    mean = sum(samples) / n
+    if n < 2:
+        return mean, float('inf')
+    variance = sum((sample - mean)**2 for sample in samples) / (n - 1)
+    return mean, des.t_quantile_95(n - 1) * math.sqrt(variance / n)
 
-# Invoke the infinite_buffer() simulator, print the results
-def simulate_infinite(rho):
-    r_avrg_pkts, r_p_idle = infinite_buffer(rho)
-    print(str(rho) + "," + str(r_avrg_pkts) + "," + str(r_p_idle))
+# Replicate a simulation until its estimates are precise enough
+# Run independent replications of the simulation and stop as soon as the
+# 95% confidence interval of every statistic is within the relative
+# precision of its mean (or is exactly zero). A statistic can have an
+# absolute floor below which its mean is held to the precision of the
+# floor instead, so that tiny probabilities (e.g. P(LOSS) at low rho) do not
+# keep the replications going to the cap (see des.SteadyState).
+# Precision is first checked after MIN_REPLICATIONS replications.
+# @param run - function: Runs one replication, returns a tuple of statistics.
+# @param precision - float: Target relative half width of the intervals.
+# @param max_replications - int: Number of replications to give up after.
+# @param floors - list[float]: Absolute floor of the magnitude of each
+#                              statistic's mean (None for no floors).
+# @return (list[(float, float)], int): The (mean, half width) of each
+#                                      statistic and the number of replications.
+def replicate(run, precision, max_replications=MAX_REPLICATIONS, floors=None):
+    samples = []
+    while len(samples) < max_replications:
+        samples.append(run())
+        intervals = [confidence_interval(column) for column in zip(*samples)]
+        if len(samples) >= MIN_REPLICATIONS and \
+                all(half_width <= precision * max(abs(mean), floor)
+                    for (mean, half_width), floor in zip(intervals, floors or [0.0] * len(intervals))):
+            break
+    return intervals, len(samples)
 
-# Invoke the finite_buffer() simulator, print the results
-def simulate_finite(rho, K):
-    r_avrg_pkts, r_p_idle, p_pkt_drop = finite_buffer(rho, K)
-    print(str(rho) + "," + str(r_avrg_pkts) + "," + str(r_p_idle) + "," + str(p_pkt_drop))
+# Derive the seed of a sweep point
+# The seed only depends on the base seed and on the point's parameters, so a
+# point gets the same random streams no matter which worker runs it or how
+# many workers there are. With common random numbers, the seed only depends
+# on the replication, so every configuration of a replication is driven by
+# the same streams and differences between them are not swamped by noise.
+# @param seed - int: Base seed of the sweep (None for unseeded runs).
+# @param rho - float: Rho value of the point.
+# @param K - int: Queue size of the point (None for infinite).
+# @param sim_time - int: Simulation time of the point.
+# @param replication - int: Replication index of the point.
+# @param crn - bool: Whether to use common random numbers.
+# @return int: Seed for the point (None for unseeded runs).
+def derive_seed(seed, rho, K, sim_time, replication, crn=False):
+    if seed is None:
+        return None
+    if crn:
+        return random.Random("%d:%d" % (seed, replication)).getrandbits(64)
+    return random.Random("%d:%r:%r:%d:%d" % (seed, rho, K, sim_time, replication)).getrandbits(64)
+
+# Build the points of a parameter sweep
+# Points are ordered by K, then rho, then replication, which is also the
+# order the rows are written in.
+# @param rhos - list[float]: Rho values to simulate.
+# @param Ks - list[int]: Queue sizes to simulate (None for infinite).
+# @param sim_time - int: Simulation time of each point.
+# @param replications - int: Number of independent replications per point.
+# @param seed - int: Base seed of the sweep (None for unseeded runs).
+# @param precision - float: Target relative precision of each point (None
+#                           for a single run per point).
+# @param max_replications - int: Cap on the replications of each point.
+# @param crn - bool: Whether to use common random numbers across points.
+# @param profile - float: Progress report interval of the instrumentation
+#                         (None to not instrument the points).
+# @param trace - str: Directory to write a trace of each point to (None to
+#                     not trace the points).
+# @param steady - float: Relative precision to stop each run at once past
+#                        its warm-up (None to run every point for sim_time).
+# @return list[SweepPoint]: The points of the sweep.
+def build_sweep(rhos, Ks, sim_time, replications=1, seed=None, precision=None,
+                max_replications=MAX_REPLICATIONS, crn=False, profile=None, trace=None, steady=None):
+    points = []
+    for K in Ks:
+        for rho in rhos:
+            for replication in range(replications):
+                trace_path = None
+                if trace is not None:
+                    trace_path = os.path.join(trace, 'rho=%r_K=%r_rep=%d.trace' % (rho, K, replication))
+                points.append(SweepPoint(rho, K, sim_time, replication,
+                                         derive_seed(seed, rho, K, sim_time, replication, crn), engine,
+                                         precision, max_replications, profile, trace_path, scheduler,
+                                         estimator, segments, steady))
+    return points
+
+# Simulate a single sweep point
+# Runs in a worker process, so the module parameters are set from the point
+# instead of being inherited from main().
+# With a precision, each statistic is reported as its mean and the half
+# width of its confidence interval, followed by the number of replications.
+# @param point - SweepPoint: The point to simulate.
+# @return tuple[float]: Statistics returned by the simulator.
+def run_sweep_point(point):
+    global T
+    global engine
+    global scheduler
+    global estimator
+    global segments
+    global steady_state
+    global streams
+    global profiler
+    global tracer
+
+    T = point.T
+    engine = point.engine
+    scheduler = point.scheduler
+    estimator = point.estimator
+    segments = point.segments
+    steady_state = point.steady_state
+    if point.K is None:
+        simulate = lambda: run_infinite(point.rho)
+    else:
+        simulate = lambda: run_finite(point.rho, point.K)
+
+    if point.profile is not None:
+        profiler = des.Profiler({'rho': point.rho, 'K': point.K, 'T': point.T,
+                                 'replication': point.replication, 'engine': point.engine},
+                                point.profile)
+
+    base_streams = RandomStreams(point.seed)
+    if point.precision is None:
+        streams = base_streams
+        if point.trace is not None:
+            tracer = des.TraceWriter(point.trace)
+        results = simulate()
+        if tracer is not None:
+            # A steady-state run ends after its last batch (its length)
+            tracer.close(results[-1] if steady_state is not None else T)
+            tracer = None
+        if profiler is not None:
+            profiler.report()
+            profiler = None
+        return results
+
+    # Every adaptive replication gets its own substreams
+    replication = 0
+    def run():
+        global streams
+        nonlocal replication
+        streams = base_streams.spawn(replication)
+        replication += 1
+        return simulate()
+
+    intervals, replications = replicate(run, point.precision, point.max_replications, STATISTIC_FLOORS)
+    if profiler is not None:
+        profiler.report()
+        profiler = None
+    return tuple(value for interval in intervals for value in interval) + (replications,)
+
+# Result cache of the sweep points (see des.ResultCache)
+# The results of a point are its tuple of statistics.
+class ResultCache(des.ResultCache):
+    SIMULATOR = 'py_lab1'
+    SOURCE = os.path.abspath(__file__)
 
 # Run the M/M/1[/K] queue simulator based on the command line options provided
 # Can call 'python [python_filename].py --help' to view all options.
 def main():
     global T
+    global engine
+    global scheduler
+    global estimator
+    global segments
 
     parser = argparse.ArgumentParser(description='Simulate networking packet buffer (ECE358 Lab1)')
-    parser.add_argument('-K', '--queue_size', metavar='n', type=int, default=None,
-                        help='Size of the queue/buffer (default: infinite)')
+    parser.add_argument('-K', '--queue_size', metavar='n', type=int, nargs='+', default=None,
+                        help='Size(s) of the queue/buffer (default: infinite)')
     parser.add_argument('-T', '--time_units', metavar='t', type=int, default=1000,
                         help='Time units to run each simulation for')
     parser.add_argument('-R', '--rho', metavar='r', type=float, default=None,
                         help='Rho value to simulate (no value implies range from [0.4, 10])')
+    parser.add_argument('-E', '--engine', choices=[ENGINE_EVENT, ENGINE_NUMPY, ENGINE_STREAMING, ENGINE_REGENERATIVE,
+                                                   ENGINE_IMPORTANCE],
+                        default=ENGINE_EVENT,
+                        help='Simulation engine (default: event; numpy is only available without -K, '
+                             'streaming runs in constant memory, regenerative splits each run over the '
+                             'workers and reports confidence intervals, importance does so too and '
+                             'estimates tiny P(LOSS) by importance sampling, with -K only)')
+    parser.add_argument('--scheduler', choices=des.SCHEDULERS, default=des.SCHEDULER_HEAP,
+                        help='Pending event set of the event engine (default: heap)')
+    parser.add_argument('--estimator', choices=[ESTIMATOR_OBSERVER, ESTIMATOR_TIME], default=ESTIMATOR_OBSERVER,
+                        help='Estimate E[N] and P(IDLE) by sampling the queue at observer events, or exactly '
+                             'from the time the queue spends at each length (default: observer)')
+    parser.add_argument('-j', '--jobs', metavar='j', type=int, default=1,
+                        help='Number of worker processes (default: 1, 0 for one per CPU)')
+    parser.add_argument('-n', '--replications', metavar='n', type=int, default=1,
+                        help='Number of independent replications of each point (default: 1)')
+    parser.add_argument('-P', '--precision', metavar='p', type=float, default=None,
+                        help='Replicate each point until the 95%% confidence intervals are within '
+                             'this relative precision, e.g. 0.05 (default: single run)')
+    parser.add_argument('--max_replications', metavar='m', type=int, default=MAX_REPLICATIONS,
+                        help='Maximum number of replications with -P (default: %d)' % MAX_REPLICATIONS)
+    parser.add_argument('-S', '--seed', metavar='s', type=int, default=None,
+                        help='Base seed for reproducible runs (default: unseeded)')
+    parser.add_argument('--profile', metavar='s', type=float, nargs='?', const=des.PROFILE_INTERVAL, default=None,
+                        help='Count events, time phases and report progress every s seconds of wall time '
+                             'as JSON on stderr (default interval: %g)' % des.PROFILE_INTERVAL)
+    parser.add_argument('--cache', metavar='dir', nargs='?', const=CACHE_DIR, default=None,
+                        help='Reuse the results of seeded points from an on-disk cache (default dir: .cache)')
+    parser.add_argument('--cache_limit', metavar='mb', type=float, default=CACHE_LIMIT,
+                        help='Size limit of the cache in MB (default: %g)' % CACHE_LIMIT)
+    parser.add_argument('--invalidate_cache', choices=['all', 'stale'], default=None,
+                        help='Remove all cached results, or only those of other simulator versions, and exit')
+    parser.add_argument('--trace', metavar='dir', default=None,
+                        help='Record the events of each point to a binary trace file in this directory')
+    parser.add_argument('--replay', metavar='file', default=None,
+                        help='Recompute E[N], P(IDLE) and P(LOSS) from a trace file instead of simulating')
+    parser.add_argument('--window', metavar='t', type=float, nargs=2, default=None,
+                        help='Only use the trace records between these two times with --replay')
+    parser.add_argument('--crn', action='store_true',
+                        help='Use common random numbers across the points of a replication (requires -S)')
+    parser.add_argument('--steady_state', metavar='p', type=float, default=None,
+                        help='Drop the warm-up of each run (MSER-5) and stop it once the 95%% confidence '
+                             'intervals are within this relative precision, e.g. 0.05; -T is then the '
+                             'longest run (event engine only)')
 
     parser.add_argument('-Q1', '--question1', action='store_true',
                         help='Calculate the values for question 1')
 
     args = parser.parse_args()
-    K = args.queue_size
+    Ks = args.queue_size or [None]
     T = args.time_units
     rho = args.rho
+    engine = args.engine
+    scheduler = args.scheduler
+    estimator = args.estimator
+
+    if engine == ENGINE_IMPORTANCE and None in Ks:
+        parser.error('the importance engine only simulates finite buffers (-K)')
+    if engine == ENGINE_REGENERATIVE and None in Ks and rho is not None and rho >= 1:
+        parser.error('the regenerative engine needs rho < 1 for the infinite buffer, '
+                     'which never empties (and so never regenerates) otherwise')
+    if engine == ENGINE_NUMPY:
+        if Ks != [None]:
+            parser.error('the numpy engine only simulates the infinite buffer')
+        if np is None:
+            parser.error('the numpy engine requires NumPy to be installed')
+    if args.crn and args.seed is None:
+        parser.error('--crn requires a seed (-S)')
+    if args.steady_state is not None:
+        if engine != ENGINE_EVENT:
+            parser.error('--steady_state is only available with the event engine')
+        if args.precision is not None:
+            parser.error('--steady_state stops single runs and cannot be combined with -P')
+    jobs = args.jobs
+    if engine in (ENGINE_REGENERATIVE, ENGINE_IMPORTANCE):
+        if args.precision is not None:
+            parser.error('the %s engine reports its own confidence intervals and cannot be combined with -P' % engine)
+        if args.trace is not None or args.profile is not None:
+            parser.error('the %s engine cannot be traced or profiled' % engine)
+        # The points are simulated one after another, each split over all workers
+        segments = jobs or os.cpu_count() or 1
+        jobs = 1
+    if args.trace is not None:
+        if engine == ENGINE_NUMPY:
+            parser.error('the numpy engine does not record traces')
+        if args.precision is not None:
+            parser.error('--trace records single runs and cannot be combined with -P')
+        os.makedirs(args.trace, exist_ok=True)
+
+    # Recompute the statistics of a recorded run
+    if args.replay is not None:
+        if np is None:
+            parser.error('--replay requires NumPy to be installed')
+        if args.window is not None and args.window[0] >= args.window[1]:
+            parser.error('--window must start before it ends')
+        trace, end_time = des.read_trace(args.replay, 'queue')
+        print('E[N],P(IDLE),P(LOSS)')
+        print(','.join(str(value) for value in trace_statistics(trace, end_time, args.window)))
+        return
+
+    cache = None
+    if args.cache is not None or args.invalidate_cache is not None:
+        cache = ResultCache(args.cache or CACHE_DIR, args.cache_limit)
+    if args.invalidate_cache is not None:
+        print('Removed %d cached results' % cache.invalidate(args.invalidate_cache == 'stale'))
+        cache.close()
+        return
 
     # Calculate the mean/variance for lab 1 question 1
     if args.question1:
+        random.seed(args.seed)
         random_array = generate_random_array(75)
 
         mean = sum(random_array) / 1000
@@ -236,16 +1195,9 @@ def main():
 
         exit()
 
-    # Header for the CSV format output indicating the type for each column
-    header = 'Rho,E[N],P(IDLE)'
-    # P(LOSS) is only needed for finite buffer simulations
-    if K is not None:
-        header += ',P(LOSS)'
-    print(header)
-
     queue_utilization_array = []
     if rho is None:
-        if K is None:
+        if Ks == [None]:
             queue_utilization_array.extend(list(range(25, 100, 10)))
         else:
             queue_utilization_array.extend(list(range(40, 200, 10)))
@@ -254,12 +1206,38 @@ def main():
     else:
         queue_utilization_array.append(rho * 100)
 
-    if K is None:
-        for rho_index in queue_utilization_array:
-            simulate_infinite(rho_index/100)
-    else:
-        for rho_index in queue_utilization_array:
-            simulate_finite(rho_index/100, K)
+    points = build_sweep([rho_index/100 for rho_index in queue_utilization_array], Ks, T,
+                         args.replications, args.seed, args.precision, args.max_replications,
+                         args.crn, args.profile, args.trace, args.steady_state)
+
+    K = -1                  # no output block started yet
+    for point, results in des.run_sweep(run_sweep_point, points, jobs, cache):
+        # Each queue size gets its own block of CSV output
+        if point.K != K:
+            K = point.K
+            # Header for the CSV format output indicating the type for each column
+            columns = ['E[N]', 'P(IDLE)']
+            # P(LOSS) is only needed for finite buffer simulations
+            if K is not None:
+                columns.append('P(LOSS)')
+            # Replicated points report the half width of each confidence interval
+            if args.precision is not None:
+                columns = [name for column in columns for name in (column, column + ' CI')]
+                columns.append('Replications')
+            elif engine == ENGINE_REGENERATIVE:
+                columns = [name for column in columns for name in (column, column + ' CI')]
+                columns.append('Cycles')
+            elif engine == ENGINE_IMPORTANCE:
+                columns = [name for column in columns for name in (column, column + ' CI')]
+                columns.extend(['P(LOSS) RE', 'Cycles'])
+            elif args.steady_state is not None:
+                columns = [name for column in columns for name in (column, column + ' CI')]
+                columns.extend(['Warm-up', 'Length'])
+            print(','.join(['Rho'] + columns))
+        print(format_row(point.rho, results), flush=True)
+
+    if cache is not None:
+        cache.close()
 
 # END MAIN
 
@@ -0,0 +1,81 @@
+##########################################################################
+# Benchmarks for the CSMA/CD simulator (ECE 358 Lab 2)
+#
+# Times lab2.simulate() over a grid of the number of nodes N (20 to 2000),
+# the arrival rate A and the simulation time T, for both persistent and
+# non-persistent CSMA/CD, with the shared harness (see bench.py), which
+# records the wall time, events per second and RSS of each case and
+# compares them against a baseline.
+##########################################################################
+
+import contextlib
+import io
+import json
+import os
+import sys
+from collections import namedtuple
+
+import lab2
+
+# The benchmark harness shared by the labs lives in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import bench
+
+# BenchCase: A single benchmark case; curve names the scaling curve it belongs to
+BenchCase = namedtuple('BenchCase', ['curve', 'N', 'A', 'persistent', 'T'])
+
+# Benchmark of the CSMA/CD simulator (see bench.Benchmark)
+class Lab2Benchmark(bench.Benchmark):
+    DESCRIPTION = 'Benchmark the CSMA/CD simulator (ECE358 Lab 2)'
+    SUITES = {
+        'quick': 2,
+        'full': 50,
+    }
+    BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+    COLUMNS = 'Curve,# Nodes (N),A,Persistent,T'
+
+    # Build the cases of a suite
+    # Each persistence mode gets an N curve at A = 7, an A curve at N = 100 and
+    # a T curve at N = 100, A = 20.
+    # @param base_time - int:   Base simulation time of the suite.
+    # @return list[BenchCase]:  The cases.
+    def build_cases(self, base_time):
+        cases = []
+        for persistent in [True, False]:
+            for n in [20, 50, 100, 200, 500, 1000, 2000]:
+                cases.append(BenchCase('N', n, 7.0, persistent, base_time))
+            for a in [5.0, 7.0, 10.0, 15.0, 20.0]:
+                cases.append(BenchCase('A', 100, a, persistent, base_time))
+            for t in sorted({max(1, base_time // 4), max(1, base_time // 2), base_time, 2 * base_time}):
+                cases.append(BenchCase('T', 100, 20.0, persistent, t))
+        return cases
+
+    # Get the name of a case
+    # @param case - BenchCase:  The case.
+    # @return str:              Unique name of the case, used as its key in the baseline.
+    def name(self, case):
+        return '%s/N=%d/A=%r/%s/T=%d' % (case.curve, case.N, case.A,
+                                         'persistent' if case.persistent else 'non-persistent', case.T)
+
+    # Run a case once
+    # The events are the events the simulation processed, as counted by its
+    # profiler; the profiler only writes its final report (to a buffer), so
+    # it costs one call per event.
+    # @param case - BenchCase:  The case to run.
+    # @return int:              Number of events the simulation processed.
+    def run(self, case):
+        config = lab2.SimConfig(case.N, case.A, case.persistent, case.T, bench.SEED, float('inf'))
+        report = io.StringIO()
+        with contextlib.redirect_stderr(report):
+            lab2.simulate(config)
+        return json.loads(report.getvalue().splitlines()[-1])['events']
+
+# Run the benchmarks based on the command line options provided
+# Can call 'python bench_lab2.py --help' to view all options.
+def main():
+    bench.main(Lab2Benchmark())
+
+# END MAIN
+
+if __name__ == '__main__':
+   main()
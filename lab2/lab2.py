@@ -13,6 +13,19 @@ import argparse
 import random
 import math
 import heapq
+import os
+import sys
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:     # without NumPy, variates are drawn with random.Random
+    np = None
+
+# The discrete-event kernel shared by the labs lives in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import des
 
 
 ####################################################
@@ -29,186 +42,517 @@ L = 1500
 D = 10
 # S: Propagation speed
 S = 2 * 10**8
-# T: Simulation time
+# T: Default simulation time
 T = 1000
 # T_prop: The propagation delay between two neighboring nodes due to fixed propagation speed and distance (0.00000005)
 T_prop = float(D) / S
 # T_trans: The transmission delay for one packet due to fixed packet size and channal speed (0.0015)
 T_trans = float(L) / R
-# persistent_simulation: Indicates whether to simulate persistent or non-persistent CSMA/SD
-persistent_simulation = True
-
-########## Global Counters for Analysis ############
-
-# c_tx_attempts: The counter for transmitted packets
-c_tx_attempts = 0
-# c_tx_success: number of packets that are transmitted successfully
-c_tx_success = 0
-# c_drop: the number of packets that been dropped
-c_drop = 0
+# VARIATE_BLOCK: Number of variates drawn per refill of a node's stream (kept small since every node has its own)
+VARIATE_BLOCK = 64
+# PROFILE_INTERVAL: Default wall time between progress reports of the profiler [s]
+PROFILE_INTERVAL = 10.0
+# PROFILE_CHECK: Transmission attempts between checks of the wall clock by the profiler
+PROFILE_CHECK = 1 << 12
+# BACKOFF_CHAIN: Backoffs sampled at once per node that sensed the bus to be busy (non-persistent)
+BACKOFF_CHAIN = 16
+# BACKOFF_BULK: Minimum number of busy nodes to sample their backoffs at once with NumPy
+BACKOFF_BULK = 64
+# SKETCH_ACCURACY: Relative accuracy of the packet delay quantiles
+SKETCH_ACCURACY = 0.01
+# DELAY_QUANTILES: Quantiles of the packet delay that are reported
+DELAY_QUANTILES = [0.5, 0.99, 0.999]
+# STEADY_BATCHES: Batches of a run of length T with a steady state precision (see des.SteadyState)
+STEADY_BATCHES = 1000
+# TRANSMIT: Kind of the simulation events, a node starting to transmit its head packet
+TRANSMIT = 0
+# CACHE_DIR: Default directory of the result cache
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+# CACHE_LIMIT: Default size limit of the result cache [MB]
+CACHE_LIMIT = 64
+
+############### Trace Constants ####################
+# Event types of the trace records (see des.TraceWriter). The value of a
+# record is the channel busy counter of the node's head packet (-1 if not
+# applicable), read back as the field busy.
+HEAD = 0        # a packet reached the head of its node's queue (at its arrival time)
+ATTEMPT = 1     # a node started transmitting its head packet
+SUCCESS = 2     # a transmission ended successfully
+COLLISION = 3   # a node detected a collision
+DROP = 4        # a packet was dropped after too many collisions
+BUSY = 5        # a node sensed the bus to be busy
+
+############### Run Configuration ##################
+
+# SimConfig: Parameters of a single simulation run
+#   N:          The number of nodes/computers connected to the LAN
+#   A:          Average packet arrival rate (packets/second) at every node
+#   persistent: Whether to simulate persistent or non-persistent CSMA/CD
+#   T:          Simulation time
+#   seed:       Seed of the run (None for an unseeded, non-reproducible run)
+#   profile:    Progress report interval of the profiler (None to not profile the run)
+#   trace:      Path to record the events of the run to (None to not trace the run)
+#   scheduler:  Pending event set of the simulation (see des.Simulator)
+#   replication: Index of the run among the independent replications of the point
+#   steady_state: Relative precision to stop the run at once past its warm-up (None to run for T)
+SimConfig = namedtuple('SimConfig', ['N', 'A', 'persistent', 'T', 'seed', 'profile', 'trace', 'scheduler',
+                                     'replication', 'steady_state'],
+                       defaults=(None, None, des.SCHEDULER_CALENDAR, 0, None))
+
+# SimResult: Counters and output data of a single simulation run
+#   c_tx_attempts:  The counter for transmitted packets
+#   c_tx_success:   Number of packets that are transmitted successfully
+#   end_time:       Time when the last successful transmission ended
+#   stats:          Packet delay and drop statistics of the run (see DelayStatistics)
+#   steady:         Warm-up and half widths of the efficiency and throughput
+#                   intervals of a run with a steady state precision (None otherwise)
+SimResult = namedtuple('SimResult', ['config', 'c_tx_attempts', 'c_tx_success',
+                                     'efficiency', 'throughput', 'end_time', 'stats', 'steady'],
+                       defaults=(None,))
 
 ####################################################
 
-# Packet class
-# Class encapsulating all data regarding an individual packet, including
-# the node it belongs to. All "node" data is contained within the head
-# packets instead (e.g. collision/channel busy counters).
-class Packet:
-    t_trans_delay = T_trans # transmission delay
-
-    def __init__(self, node, t_arrival):
-        self.t_arrival = t_arrival      # the time when the packet is generated on node
-        self.node = node                # the index of node where this packet generated
-        self.t_trans = t_arrival        # the actual transmission start time
-        self.c_collision = 0            # the number of collisions the packet has expereienced when it is being transmitted
-        self.t_remove = 0               # the time when the packet has been removed from the node, either been transmitted or droped
-        self.c_channel_busy = 0         # the counter to record how many times the packet found the bus is busy when it attempts to tranmit
-
+# Node state
+# Structure-of-arrays state of the nodes' packet queue heads. Column i holds
+# the data of node i's head packet (e.g. collision/channel busy counters),
+# so moving on to a node's next packet overwrites its column in place
+# instead of allocating a new object per packet.
+class NodeState:
+    __slots__ = ('t_arrival', 't_head', 't_trans', 'c_collision', 'c_channel_busy', 'f_active')
+
+    def __init__(self, n):
+        self.t_arrival = array('d', [0.0]) * n      # the time when the head packet is generated on node
+        self.t_head = array('d', [0.0]) * n         # the time when the head packet reached the head of the queue
+        self.t_trans = array('d', [0.0]) * n        # the actual transmission start time of the head packet
+        self.c_collision = array('i', [0]) * n      # the number of collisions the head packet has expereienced when it is being transmitted
+        self.c_channel_busy = array('i', [0]) * n   # the counter to record how many times the head packet found the bus is busy when it attempts to tranmit
+        self.f_active = bytearray(n)                # whether the node still has a packet to transmit
+
+    # Put a new packet at the head of a node's queue
+    # @param i - int:           Index of the node.
+    # @param t_arrival - float: The time when the packet is generated on node.
+    # @param t_trans - float:   The transmission start time of the packet.
+    def reset(self, i, t_arrival, t_trans):
+        self.t_arrival[i] = t_arrival
+        self.t_head[i] = t_trans
+        self.t_trans[i] = t_trans
+        self.c_collision[i] = 0
+        self.c_channel_busy[i] = 0
+        self.f_active[i] = 1
+
+# Quantile sketch
+# Mergeable sketch of the distribution of positive values (DDSketch, Masson
+# et al., 2019). Values are counted in buckets whose bounds grow by a factor
+# of (1 + a)/(1 - a), so every quantile is estimated to within the relative
+# accuracy a from the counts alone. The number of buckets grows with the
+# logarithm of the range of the values (about 115 per decade for a = 1%),
+# not with their number, and sketches are merged by adding their counts.
+class QuantileSketch:
+    __slots__ = ('accuracy', 'log_gamma', 'buckets', 'count')
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.accuracy = accuracy                # relative accuracy of the quantiles
+        self.log_gamma = math.log((1 + accuracy) / (1 - accuracy))
+        self.buckets = {}                       # number of values in each bucket, by index
+        self.count = 0                          # number of values
+
+    # Add a value
+    # @param x - float:     The value (must be positive).
+    def add(self, x):
+        k = math.ceil(math.log(x) / self.log_gamma)
+        self.buckets[k] = self.buckets.get(k, 0) + 1
+        self.count += 1
+
+    # Add the values of another sketch
+    # @param other - QuantileSketch: Sketch with the same accuracy.
+    def merge(self, other):
+        for k, count in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + count
+        self.count += other.count
+
+    # Estimate a quantile
+    # The estimate is the midpoint (relative to its bounds) of the bucket
+    # holding the value of that rank.
+    # @param q - float:     Quantile in [0, 1].
+    # @return float:        Estimate of the quantile (0 if there are no values).
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if seen > rank:
+                break
+        gamma = math.exp(self.log_gamma)
+        return 2 * gamma**k / (gamma + 1)
+
+# Delay statistics
+# Streaming statistics of the packets of a run, fed as packets are
+# transmitted successfully or dropped: per node, running counts of the
+# delivered and dropped packets and sums of their delays (from arrival to
+# the end of the successful transmission) and access delays (from reaching
+# the head of the queue to the start of the successful transmission), and
+# a quantile sketch of the delays of all nodes. The memory is O(N) no matter
+# how many packets pass, and the statistics of independent runs of the
+# same configuration are merged by adding them up.
+class DelayStatistics:
+    __slots__ = ('c_delivered', 'c_dropped', 's_delay', 's_access', 'delays')
+
+    def __init__(self, n):
+        self.c_delivered = array('l', [0]) * n      # number of packets of each node transmitted successfully
+        self.c_dropped = array('l', [0]) * n        # number of packets of each node dropped
+        self.s_delay = array('d', [0.0]) * n        # sum of the delays of each node's delivered packets
+        self.s_access = array('d', [0.0]) * n       # sum of the access delays of each node's delivered packets
+        self.delays = QuantileSketch()              # delays of the delivered packets of all nodes
+
+    # Count a successfully transmitted packet
+    # @param i - int:               Index of the packet's node.
+    # @param delay - float:         Time from the packet's arrival to the end of its transmission.
+    # @param access_delay - float:  Time from the packet reaching the head of
+    #                               the queue to the start of its transmission.
+    def success(self, i, delay, access_delay):
+        self.c_delivered[i] += 1
+        self.s_delay[i] += delay
+        self.s_access[i] += access_delay
+        self.delays.add(delay)
+
+    # Count a dropped packet
+    # @param i - int:   Index of the packet's node.
+    def drop(self, i):
+        self.c_dropped[i] += 1
+
+    # Add the statistics of another run of the same configuration
+    # @param other - DelayStatistics: Statistics of the run.
+    def merge(self, other):
+        for i in range(len(self.c_delivered)):
+            self.c_delivered[i] += other.c_delivered[i]
+            self.c_dropped[i] += other.c_dropped[i]
+            self.s_delay[i] += other.s_delay[i]
+            self.s_access[i] += other.s_access[i]
+        self.delays.merge(other.delays)
+
+    # Summarize the statistics
+    # @return dict:     Drop rate, mean delay, delay quantiles (see
+    #                   DELAY_QUANTILES) and mean access delay, overall and
+    #                   (except the quantiles) per node.
+    def summary(self):
+        def rates(c_delivered, c_dropped, s_delay, s_access):
+            c_packets = c_delivered + c_dropped
+            return {'delivered': c_delivered, 'dropped': c_dropped,
+                    'drop_rate': c_dropped / c_packets if c_packets else 0.0,
+                    'delay': s_delay / c_delivered if c_delivered else 0.0,
+                    'access_delay': s_access / c_delivered if c_delivered else 0.0}
+
+        stats = rates(sum(self.c_delivered), sum(self.c_dropped), sum(self.s_delay), sum(self.s_access))
+        stats['quantiles'] = [self.delays.quantile(q) for q in DELAY_QUANTILES]
+        stats['nodes'] = [rates(*node) for node in zip(self.c_delivered, self.c_dropped, self.s_delay, self.s_access)]
+        return stats
+
+    # Convert the statistics to JSON-compatible data (e.g. for the result cache)
+    # @return dict:     The counters, sums and sketch buckets.
+    def toDict(self):
+        return {'c_delivered': self.c_delivered.tolist(), 'c_dropped': self.c_dropped.tolist(),
+                's_delay': self.s_delay.tolist(), 's_access': self.s_access.tolist(),
+                'accuracy': self.delays.accuracy, 'buckets': sorted(self.delays.buckets.items())}
+
+# Restore delay statistics converted by DelayStatistics.toDict()
+# @param data - dict:       The converted statistics.
+# @return DelayStatistics:  The statistics.
+def loadDelayStatistics(data):
+    stats = DelayStatistics(0)
+    stats.c_delivered = array('l', data['c_delivered'])
+    stats.c_dropped = array('l', data['c_dropped'])
+    stats.s_delay = array('d', data['s_delay'])
+    stats.s_access = array('d', data['s_access'])
+    stats.delays = QuantileSketch(data['accuracy'])
+    stats.delays.buckets = {k: count for k, count in data['buckets']}
+    stats.delays.count = sum(stats.delays.buckets.values())
+    return stats
+
+# Random streams
+# Independent random streams per purpose and per node: each node has one
+# stream for its packet arrivals and one for its backoff times, all derived
+# from a single seed. A node's arrivals therefore do not depend on how many
+# backoffs it or any other node drew, so persistent and non-persistent runs
+# with the same seed see the exact same traffic (common random numbers; see
+# des.seeded_stream()).
+class RandomStreams:
+    def __init__(self, seed, n):
+        self.seed = seed                                                                        # seed of the streams (None for unseeded)
+        self.arrival = [des.seeded_stream(seed, ('arrival', i), VARIATE_BLOCK) for i in range(n)]   # packet inter-arrival times of each node
+        self.backoff = [des.seeded_stream(seed, ('backoff', i), VARIATE_BLOCK) for i in range(n)]   # backoff times of each node
+
+    # Spawn independent substreams (see des.spawn_seed())
+    # @param index - int:   Index of the substreams.
+    # @return RandomStreams: Streams seeded from this seed and the index.
+    def spawn(self, index):
+        return RandomStreams(des.spawn_seed(self.seed, index), len(self.arrival))
+
+# Calculate statistics from a trace
+# Efficiency and throughput are recomputed from the attempt and success
+# records. The delay of a packet is the time from its head record to its
+# success or drop record; both are found by stably sorting the records by
+# node, so a packet's end record directly follows its head record.
+# @param trace - numpy.ndarray: Records of a trace, or a slice of them.
+# @param n - int:               Number of nodes.
+# @return dict:                 Efficiency, throughput, drop count, mean
+#                               packet delay and mean delay per node.
+def traceStatistics(trace, n):
+    types = trace['type']
+    c_tx_attempts = np.count_nonzero(types == ATTEMPT)
+    success = types == SUCCESS
+    c_tx_success = np.count_nonzero(success)
+    end_time = float(trace['time'][success].max()) if c_tx_success else 0.0
+
+    packets = trace[(types == HEAD) | success | (types == DROP)]
+    packets = packets[np.argsort(packets['node'], kind='stable')]
+    done = (packets['type'][1:] != HEAD) & (packets['type'][:-1] == HEAD) \
+        & (packets['node'][1:] == packets['node'][:-1])
+    delays = packets['time'][1:][done] - packets['time'][:-1][done]
+    nodes = packets['node'][1:][done]
+    c_packets = np.bincount(nodes, minlength=n)
+    node_delays = np.bincount(nodes, weights=delays, minlength=n) / np.maximum(c_packets, 1)
+
+    return {'efficiency': float(c_tx_success / c_tx_attempts) if c_tx_attempts else 0.0,
+            'throughput': float(c_tx_success * L) / (1000000.0 * end_time) if end_time else 0.0,
+            'drops': int(np.count_nonzero(types == DROP)),
+            'delay': float(delays.mean()) if delays.size else 0.0,
+            'node_delays': node_delays.tolist()}
 
 # Generate value from a random distribution
 # Generate a random value from the Poisson distribution given parameter
 # lambda (typically the arrival rate of the simulation).
 # @param lambda_para - float:   Parameter for the random distribution.
+# @param rng - VariateStream:   Stream to draw from (default: global stream).
 # @return float:                Random value following the distribution.
-def generate_random(lambda_para):
-    return - (1 / lambda_para) * math.log(1 - random.uniform(0, 1))
-
-# Check if all nodes are empty
-# Check if all nodes have no more packets to transmit.
-# @param node_head - list[Packet]:  List of the nodes' packet queue heads.
-# @return bool:                     True if all nodes are empty; false otherwise.
-def allNodesEmpty(node_head):
-    empty = True
-    for i in range(N):
-        empty = empty and node_head[i] is None
-    return empty
-
-# Find the next packet to transmit
-# Find the node with the next packet that has the lowest transmission start
-# time within the packet neads and return its node index and transmission
-# start time.
-# @param node_head - list[Packet]:  List of the nodes' packet queue heads.
-# @return (int, float):             The next node's index and the transmission start
-#                                   time respectively.
-def findNextPacket(node_head):
-    trans_time = None
-    for i in range(N):
-        if node_head[i] is not None:
-            if trans_time == None or trans_time >= node_head[i].t_trans:
-                trans_time = node_head[i].t_trans
-                next_node = i
-
-    return next_node, trans_time
+def generate_random(lambda_para, rng=random):
+    return rng.expovariate(lambda_para)
 
 # Get the propagation delay
 # Get the appropriate propagation delay between two nodes.
 # @param src - int: Source node's index.
-# @param des - int: Destination node's index.
-# @return int:      Propagation delay between src and des.
-def getPropagationDelay(src, des):
-    return abs(des-src) * T_prop
+# @param dst - int: Destination node's index.
+# @return int:      Propagation delay between src and dst.
+def getPropagationDelay(src, dst):
+    return abs(dst-src) * T_prop
 
 # Get the next packet in the queue
-# Get the next packet to put into a node's head of the queue. This packet
-# is generated on the fly and the "initial" arrival time is based on the
+# Put the next packet into a node's head of the queue. This packet is
+# generated on the fly and the "initial" arrival time is based on the
 # previous packet's "initial" arrival time. This should act the same as if
 # the nodes were all generated beforehand, and should only serve the
 # purpose of saving memory.
-# @param node_head - list[Packet]:  List of the nodes' packet queue heads.
+# @param nodes - NodeState:         State of the nodes' packet queue heads.
 # @param i - int:                   Index of the node to get a new packet for.
 # @param previous_pkt_done - float: Current time of when the previous packet
 #                                   was "done" (successfully transmitted or
 #                                   dropped) and when the new packet is to
 #                                   be the new head of the node's queue.
-# @return Packet:                   New packet for the head of the node's queue.
-def getNextPacket(node_head, i, previous_pkt_done):
+# @param arrival_rate - float:      Average packet arrival rate of the node.
+# @param sim_time - float:          Simulation time; later packets are not generated.
+# @param rng - VariateStream:       The node's arrival stream.
+# @return bool:                     True if the node has a new head packet;
+#                                   false if it has no more packets.
+def getNextPacket(nodes, i, previous_pkt_done, arrival_rate, sim_time, rng):
     # Generate the next packet that arriving the node
-    previous_pkt = node_head[i]
-    next_pkt_arrival = previous_pkt.t_arrival + generate_random(A)
-    next_pkt = Packet(i, next_pkt_arrival)
+    next_pkt_arrival = nodes.t_arrival[i] + generate_random(arrival_rate, rng)
 
     # Check T exceed
-    if next_pkt_arrival > T:
-        return None
-    else:
-        # Check the arrival time with the transmit finish time
-        if next_pkt_arrival < previous_pkt_done:
-            next_pkt.t_trans = previous_pkt_done
+    if next_pkt_arrival > sim_time:
+        nodes.f_active[i] = 0
+        return False
 
-    return next_pkt
+    # Check the arrival time with the transmit finish time
+    nodes.reset(i, next_pkt_arrival, max(next_pkt_arrival, previous_pkt_done))
+    return True
 
 # Calculate exponential backoff time
 # Calculate the random (exponential) backoff time given an index.
-# @param index - int:   Index for the exponential backoff.
-# @return float:        Backoff time.
-def calcExpBackoff(index):
-    rand = random.uniform(0, (2 ** index) - 1)
+# @param index - int:           Index for the exponential backoff.
+# @param rng - VariateStream:   Stream to draw from (default: global stream).
+# @return float:                Backoff time.
+def calcExpBackoff(index, rng=random):
+    rand = rng.uniform(0, (2 ** index) - 1)
     # Tp = 512 bit-time wait (512 / R)
     return (rand * 512 / R)
 
+# Back off nodes that sensed the bus to be busy (non-persistent)
+# Each node backs off again and again until its transmission start time
+# reaches the end of the busy period it sensed, with its channel busy
+# counter incremented up to 10 before every backoff. With NumPy, the chains
+# of all nodes are sampled at once: the next BACKOFF_CHAIN uniform variates
+# of each node's stream are scaled by the counters they would be drawn
+# with, accumulated onto the start time, and searched for the first time at
+# or past the end; only the variates up to there are used up. The variates,
+# the order of the additions and hence the results are exactly those of
+# backing off one at a time. A node whose start time is already at or past
+# the end takes no backoff, so such nodes are left out of the chains.
+# @param busy - list[(int, float)]: Nodes that sensed the bus to be busy
+#                                   and the end of the busy period for each.
+# @param t_trans - array[float]:    Transmission start times of the nodes' heads.
+# @param c_channel_busy - array[int]: Channel busy counters of the nodes' heads.
+# @param backoff_rng - list[VariateStream]: Backoff streams of the nodes.
+# @return int:                      Total number of backoffs.
+def backoffBusyNodes(busy, t_trans, c_channel_busy, backoff_rng):
+    c_backoff = 0
+    if np is None or len(busy) < BACKOFF_BULK:
+        for i, t_end in busy:
+            while t_trans[i] < t_end:
+                c_backoff += 1
+
+                # This implementation caps the counter limit at 10 and continuously waits to transmit the same packet
+                if c_channel_busy[i] < 10:
+                    c_channel_busy[i] += 1
+                t_trans[i] += calcExpBackoff(c_channel_busy[i], backoff_rng[i])
+
+                # This implementation drops the packet after reaching the counter limit
+                # c_channel_busy[i] += 1
+                # if c_channel_busy[i] <= 10:
+                #     t_trans[i] += calcExpBackoff(c_channel_busy[i], backoff_rng[i])
+                # else:
+                #     getNextPacket(nodes, i, t_trans[i], A, T, arrival_rng[i])
+        return c_backoff
+
+    steps = np.arange(1, BACKOFF_CHAIN + 1)
+    busy = [(i, t_end) for i, t_end in busy if t_trans[i] < t_end]
+    while busy:
+        # Start time followed by the backoffs, so the cumulative sum adds in the same order as the loop
+        counters = np.minimum(np.array([c_channel_busy[i] for i, _ in busy])[:, None] + steps, 10)
+        times = np.empty((len(busy), BACKOFF_CHAIN + 1))
+        times[:, 0] = [t_trans[i] for i, _ in busy]
+        times[:, 1:] = (2.0 ** counters - 1) * np.array([backoff_rng[i].peek_uniforms(BACKOFF_CHAIN)
+                                                         for i, _ in busy]) * 512 / R
+        np.cumsum(times, axis=1, out=times)
+        crossed = times[:, 1:] >= np.array([t_end for _, t_end in busy])[:, None]
+        backoffs = np.where(crossed.any(axis=1), crossed.argmax(axis=1) + 1, BACKOFF_CHAIN).tolist()
+
+        # Chains that did not reach the end within BACKOFF_CHAIN backoffs continue
+        remaining = []
+        for (i, t_end), row, n in zip(busy, times, backoffs):
+            backoff_rng[i].skip_uniforms(n)
+            t_trans[i] = row[n]
+            c_channel_busy[i] = min(c_channel_busy[i] + n, 10)
+            c_backoff += n
+            if t_trans[i] < t_end:
+                remaining.append((i, t_end))
+        busy = remaining
+    return c_backoff
+
 # Simulate CSMA/CD
-# Begin the CSMA/CD simulation with the specified global parameters.
-# @sideeffect:  Print data regarding the simulation's efficiency and
-#               throughput in CSV format.
-def simulate():
-    global c_tx_attempts
-    global c_tx_success    
-
-    c_tx_success = 0
-    c_tx_attempts = 0
-
-    # N number of nodes, all heads begin empty
-    node_head = [None,] * N
+# Run the CSMA/CD simulation with the given parameters. All state of the
+# run is local, so several runs can execute in one process. Replications
+# of a point draw from their own substreams of the point's seed.
+# With a steady state precision, the run is simulated in STEADY_BATCHES
+# batches of length T/STEADY_BATCHES and stopped by des.SteadyState; the
+# efficiency and throughput are then those of the batches after the
+# warm-up and the end time is where the run stopped. The delay statistics
+# always cover the whole run.
+# @param config - SimConfig:    Parameters of the run.
+# @return SimResult:            Data regarding the simulation's efficiency,
+#                               throughput and packet delays.
+def simulate(config):
+    N, A, T = config.N, config.A, config.T
+    persistent_simulation = config.persistent
+    streams = RandomStreams(config.seed, N)
+    if config.replication:
+        streams = streams.spawn(config.replication)
+    arrival_rng = streams.arrival
+    backoff_rng = streams.backoff
+
+    c_tx_success = 0        # number of packets that are transmitted successfully
+    c_tx_attempts = 0       # the counter for transmitted packets
+    c_collisions = 0        # number of transmissions that ended in a collision
+    c_busy_sense = 0        # number of times a node sensed the bus to be busy
+    c_backoff = 0           # number of non-persistent backoff iterations
+    c_drop = 0              # the number of packets that been dropped
+    stats = DelayStatistics(N)
+
+    prof = None
+    if config.profile is not None:
+        prof = des.Profiler({'N': N, 'A': A, 'persistent': persistent_simulation, 'T': T},
+                            config.profile, PROFILE_CHECK)
+        prof.phase('setup')
+    tr = None
+    if config.trace is not None:
+        tr = des.TraceWriter(config.trace)
+
+    # N number of nodes, each starting with its first packet at the head
+    nodes = NodeState(N)
+    t_trans = nodes.t_trans
+    f_active = nodes.f_active
+    c_collision = nodes.c_collision
+    c_channel_busy = nodes.c_channel_busy
     end_time = 0
 
     for i in range(N):
-        node_head[i] = Packet(i, generate_random(A))
-
-    while(not allNodesEmpty(node_head)):
-        # Find the earliest node_head
-        trans_node, trans_start_at_src = findNextPacket(node_head)
+        t_arrival = generate_random(A, arrival_rng[i])
+        nodes.reset(i, t_arrival, t_arrival)
+        if tr is not None:
+            tr.record(t_arrival, HEAD, i, -1, 0)
+
+    # Propagation delay to the farthest node; no node beyond the end of a
+    # transmission plus this delay can collide with it or sense it
+    max_prop = getPropagationDelay(0, N - 1)
+
+    # Each active node has one pending event, the transmission of its head
+    # packet; simultaneous transmissions go to the highest node index
+    sim = des.Simulator(config.scheduler)
+    pending = [sim.schedule(t_trans[i], TRANSMIT, i, -i) for i in range(N)]
+
+    # Reschedule a node's transmission after its head changed, or cancel it
+    # if the node has no more packets
+    # @param i - int:   Index of the node whose head changed.
+    def update(i):
+        if pending[i] is not None:
+            sim.cancel(pending[i])
+        pending[i] = sim.schedule(t_trans[i], TRANSMIT, i, -i) if f_active[i] else None
+
+    # The earliest node head starts transmitting
+    # @param event - tuple: The transmission event.
+    def transmit(event):
+        nonlocal c_tx_success, c_tx_attempts, c_collisions, c_busy_sense, c_backoff, c_drop, end_time
+        trans_node, trans_start_at_src = event[4], event[0]
+        pending[trans_node] = None
+        if prof is not None:
+            prof.phase('collision')
         # Transmit the targeted head packet
-        trans_packet = node_head[trans_node]
-        trans_end_at_src = trans_start_at_src + trans_packet.t_trans_delay
+        trans_end_at_src = trans_start_at_src + T_trans
         c_tx_attempts+=1
-        node_head[trans_node].c_channel_busy = 0
+        c_channel_busy[trans_node] = 0
+        if tr is not None:
+            tr.record(trans_start_at_src, ATTEMPT, trans_node, -1, c_collision[trans_node])
 
         # Flag to check if collision occur
         f_collision = False
         collision_nodes = []
+        busy_nodes = []
         t_collision_detected = -1
 
-        # Check possible collisions for each node
-        for i in range(N):
-            if i != trans_node and node_head[i] is not None:
+        # Check possible collisions for each node within the propagation window
+        for i in sorted(head[4] for head in sim.window(trans_start_at_src, trans_end_at_src + max_prop)):
+            if i != trans_node:
                 # Here is the time for each node to check the bus is busy or collision happen.
                 # For 1-persistent, it keep checking the bus, as long as no collision, its t_trans will not be updated.
 
                 # Bus busy or node idle through entire transmission
-                if node_head[i].t_trans > trans_start_at_src + getPropagationDelay(trans_node, i):
+                if t_trans[i] > trans_start_at_src + getPropagationDelay(trans_node, i):
 
                     # Bus detected to be busy
-                    if node_head[i].t_trans < trans_end_at_src + getPropagationDelay(trans_node, i):
+                    if t_trans[i] < trans_end_at_src + getPropagationDelay(trans_node, i):
+                        c_busy_sense += 1
                         if persistent_simulation:
+                            if tr is not None:
+                                tr.record(t_trans[i], BUSY, i, c_channel_busy[i], c_collision[i])
                             # Greedy; set start of transmission time immediately to when the current transmission seems to end
-                            node_head[i].t_trans = trans_end_at_src + getPropagationDelay(trans_node, i)
+                            t_trans[i] = trans_end_at_src + getPropagationDelay(trans_node, i)
+                            update(i)
 
                         if not persistent_simulation:
                             # It is possible that despite adding some backoff/waiting time, the channel is still detected to be busy
-                            # due to the same transmitting node. In this case, loop until the wait time is sufficiently large.
-                            while node_head[i] is not None and node_head[i].t_trans < trans_end_at_src + getPropagationDelay(trans_node, i):
-
-                                # This implementation caps the counter limit at 10 and continuously waits to transmit the same packet
-                                if node_head[i].c_channel_busy < 10:
-                                    node_head[i].c_channel_busy += 1
-                                node_head[i].t_trans += calcExpBackoff(node_head[i].c_channel_busy)
-
-                                # This implementation drops the packet after reaching the counter limit
-                                # node_head[i].c_channel_busy += 1
-                                # if node_head[i].c_channel_busy <= 10:
-                                #     node_head[i].t_trans += calcExpBackoff(node_head[i].c_channel_busy)
-                                # else:
-                                #     node_head[i] = getNextPacket(node_head, i, node_head[i].t_trans)
+                            # due to the same transmitting node. In this case, back off until the wait time is sufficiently large;
+                            # the backoffs of all busy nodes are sampled together after the window is checked.
+                            busy_nodes.append((i, trans_end_at_src + getPropagationDelay(trans_node, i)))
 
                 # Collision
                 else:
@@ -217,60 +561,325 @@ def simulate():
                     c_tx_attempts+=1
                     # Node i has sensed the channel to be idle and so began transmission before colliding into the currently-transmitting node
                     # The channel busy counter is reset since the channel was sensed as idle
-                    node_head[i].c_channel_busy = 0
+                    c_channel_busy[i] = 0
+                    if tr is not None:
+                        tr.record(t_trans[i], ATTEMPT, i, -1, c_collision[i])
                     # This determines when the currently-transmitting node first detects a collision - through the earliest time
-                    if t_collision_detected == -1 or t_collision_detected > (node_head[i].t_trans + getPropagationDelay(i, trans_node)):
-                        t_collision_detected = node_head[i].t_trans + getPropagationDelay(i, trans_node)
+                    if t_collision_detected == -1 or t_collision_detected > (t_trans[i] + getPropagationDelay(i, trans_node)):
+                        t_collision_detected = t_trans[i] + getPropagationDelay(i, trans_node)
         
+        if busy_nodes:
+            if prof is not None:
+                prof.phase('backoff')
+            if tr is not None:
+                for i, _ in busy_nodes:
+                    tr.record(t_trans[i], BUSY, i, c_channel_busy[i], c_collision[i])
+            c_backoff += backoffBusyNodes(busy_nodes, t_trans, c_channel_busy, backoff_rng)
+            for i, _ in busy_nodes:
+                update(i)
+
         # If a collision has occurred
+        if prof is not None:
+            prof.phase('resolve')
         if f_collision == True:
+            c_collisions += 1
             collision_nodes.append(trans_node)
             for i in collision_nodes:
             # update the wait time
-                node_head[i].c_collision += 1
-                if node_head[i].c_collision <= 10:
+                c_collision[i] += 1
+                if tr is not None:
+                    tr.record(t_collision_detected + getPropagationDelay(i, trans_node), COLLISION, i, -1, c_collision[i])
+                if c_collision[i] <= 10:
                     # Assuming all collision detections are relative to collision detected by
                     # transmitting node, + propagation delay from transmitting node to colliding nodes
-                    node_head[i].t_trans = t_collision_detected + getPropagationDelay(i, trans_node) + calcExpBackoff(node_head[i].c_collision)
+                    t_trans[i] = t_collision_detected + getPropagationDelay(i, trans_node) + calcExpBackoff(c_collision[i], backoff_rng[i])
 
                 else:
                     # Drop packet, move next packet to node head 
-                    node_head[i] = getNextPacket(node_head, i, t_collision_detected + getPropagationDelay(i, trans_node))                                                                                                                        
+                    c_drop += 1
+                    stats.drop(i)
+                    if tr is not None:
+                        tr.record(t_collision_detected + getPropagationDelay(i, trans_node), DROP, i, -1, c_collision[i])
+                    if getNextPacket(nodes, i, t_collision_detected + getPropagationDelay(i, trans_node), A, T, arrival_rng[i]) \
+                            and tr is not None:
+                        tr.record(nodes.t_arrival[i], HEAD, i, -1, 0)
+                update(i)
         else:
             c_tx_success += 1
             end_time = trans_end_at_src
-            node_head[trans_node] = getNextPacket(node_head, trans_node, trans_end_at_src)
-
+            stats.success(trans_node, trans_end_at_src - nodes.t_arrival[trans_node],
+                          trans_start_at_src - nodes.t_head[trans_node])
+            if tr is not None:
+                tr.record(trans_end_at_src, SUCCESS, trans_node, -1, c_collision[trans_node])
+            if getNextPacket(nodes, trans_node, trans_end_at_src, A, T, arrival_rng[trans_node]) and tr is not None:
+                tr.record(nodes.t_arrival[trans_node], HEAD, trans_node, -1, 0)
+            update(trans_node)
+        if prof is not None:
+            prof.phase('select')
+
+    if prof is not None:
+        prof.phase('select')
+    steady = None
+    if config.steady_state is None:
+        sim.run([transmit], profiler=prof)
+    else:
+        # Run batch after batch, the warm-up being found on the efficiency
+        rule = des.SteadyState(config.steady_state)
+        batch_time = T / STEADY_BATCHES
+        previous = (0, 0)
+        for index in range(1, STEADY_BATCHES + 1):
+            sim.run([transmit], until=index * batch_time, profiler=prof)
+            c_batch_success = c_tx_success - previous[0]
+            stop = rule.add([(c_batch_success, c_tx_attempts - previous[1]),
+                             (c_batch_success * L / 1000000.0, batch_time)])
+            previous = (c_tx_success, c_tx_attempts)
+            if stop:
+                break
+        else:
+            rule.check()
+        (efficiency, efficiency_ci), (throughput, throughput_ci) = rule.intervals
+        steady = {'warmup': rule.warmup * batch_time, 'efficiency': efficiency_ci, 'throughput': throughput_ci}
+        end_time = len(rule.batches) * batch_time
+
+    if prof is not None:
+        prof.count('attempt', c_tx_attempts)
+        prof.count('success', c_tx_success)
+        prof.count('collision', c_collisions)
+        prof.count('busy_sense', c_busy_sense)
+        prof.count('backoff_iteration', c_backoff)
+        prof.count('drop', c_drop)
+        prof.report()
+    if tr is not None:
+        tr.close(end_time)
+
+    if steady is None:
+        efficiency = c_tx_success / c_tx_attempts
+        throughput = float(c_tx_success * L) / (1000000.0 * end_time)
+    return SimResult(config, c_tx_attempts, c_tx_success, efficiency, throughput, end_time, stats, steady)
+
+# Merge the results of the replications of a point
+# Counters and delay statistics are added up, and the efficiency and
+# throughput are recomputed from the totals; the end time is the mean of the
+# replications' end times.
+# @param results - list[SimResult]: Results of the replications.
+# @return SimResult:                Result of all replications together.
+def mergeResults(results):
+    stats = DelayStatistics(results[0].config.N)
+    for result in results:
+        stats.merge(result.stats)
+    c_tx_attempts = sum(result.c_tx_attempts for result in results)
+    c_tx_success = sum(result.c_tx_success for result in results)
+    end_time = sum(result.end_time for result in results) / len(results)
     efficiency = c_tx_success / c_tx_attempts
-    throughput = float(c_tx_success * L) / (1000000.0 * end_time)
-    print(str(N) + ',' + str(efficiency) + ',' + str(throughput) + ', ' + str(end_time))
-
+    throughput = float(c_tx_success * L) / (1000000.0 * end_time * len(results))
+    return SimResult(results[0].config, c_tx_attempts, c_tx_success, efficiency, throughput, end_time, stats)
+
+# Format one line of the CSV output
+# With a steady state precision, the efficiency and throughput are followed by
+# the half widths of their intervals, and the end time by the warm-up.
+# @param result - SimResult:    Result of a simulation run.
+# @param delays - bool:         Whether to add the drop rate and the packet delay statistics.
+# @return str:                  Comma separated row.
+def formatResult(result, delays=False):
+    if result.steady is not None:
+        row = '%d,%r,%r,%r,%r, %r,%r' % (result.config.N, result.efficiency, result.steady['efficiency'],
+                                         result.throughput, result.steady['throughput'],
+                                         result.end_time, result.steady['warmup'])
+    else:
+        row = str(result.config.N) + ',' + str(result.efficiency) + ',' + str(result.throughput) + ', ' + str(result.end_time)
+    if delays:
+        stats = result.stats.summary()
+        row += ',' + ','.join(repr(value) for value in
+                              [stats['drop_rate'], stats['delay']] + stats['quantiles'] + [stats['access_delay']])
+    return row
+
+# Derive the seed of a sweep point
+# The seed only depends on the base seed and on the point's parameters, so a
+# point gets the same random streams no matter which worker runs it. With
+# common random numbers every point uses the base seed itself, so paired
+# configurations (e.g. persistent and non-persistent) see the same traffic.
+# @param seed - int:            Base seed of the sweep (None for unseeded runs).
+# @param n - int:               Number of nodes of the point.
+# @param a - float:             Arrival rate of the point.
+# @param persistent - bool:     Persistence of the point.
+# @param sim_time - int:        Simulation time of the point.
+# @param crn - bool:            Whether to use common random numbers.
+# @return int:                  Seed for the point (None for unseeded runs).
+def deriveSeed(seed, n, a, persistent, sim_time, crn=False):
+    if seed is None or crn:
+        return seed
+    return random.Random("%d:%d:%r:%r:%d" % (seed, n, a, persistent, sim_time)).getrandbits(64)
+
+# Build the points of a parameter sweep
+# Points are ordered by persistence, then arrival rate, then number of
+# nodes, the same order the Makefile targets run them in.
+# @param Ns - list[int]:            Numbers of nodes to simulate.
+# @param As - list[float]:          Arrival rates to simulate.
+# @param persistences - list[bool]: Persistence modes to simulate.
+# @param sim_time - int:            Simulation time of each point.
+# @param seed - int:                Base seed of the sweep (None for unseeded runs).
+# @param crn - bool:                Whether to use common random numbers across points.
+# @param profile - float:           Progress report interval of the profiler (None to not profile).
+# @param trace - str:               Directory to write a trace of each point to (None to not trace).
+# @param scheduler - str:           Pending event set of the simulations.
+# @param replications - int:        Number of independent replications per point,
+#                                   which follow each other.
+# @param steady - float:            Relative precision to stop each run at once past
+#                                   its warm-up (None to run every point for sim_time).
+# @return list[SimConfig]:          The points of the sweep.
+def buildSweep(Ns, As, persistences, sim_time, seed=None, crn=False, profile=None, trace=None,
+               scheduler=des.SCHEDULER_CALENDAR, replications=1, steady=None):
+    return [SimConfig(n, a, persistent, sim_time, deriveSeed(seed, n, a, persistent, sim_time, crn), profile,
+                      None if trace is None else
+                      os.path.join(trace, 'N=%d_A=%r_persistent=%r%s.trace' %
+                                   (n, a, persistent, '_rep=%d' % replication if replications > 1 else '')),
+                      scheduler, replication, steady)
+            for persistent in persistences for a in As for n in Ns for replication in range(replications)]
+
+# Simulate a single sweep point
+# Runs in a worker process; the point carries its own seed.
+# @param config - SimConfig:    The point to simulate.
+# @return SimResult:            Result of the run.
+def runSweepPoint(config):
+    return simulate(config)
+
+# Result cache of the sweep points (see des.ResultCache)
+# A result is stored as its counts, efficiency, throughput and end time,
+# followed by its delay statistics and steady-state summary.
+class ResultCache(des.ResultCache):
+    SIMULATOR = 'lab2'
+    SOURCE = os.path.abspath(__file__)
+
+    # Convert a result to JSON-serializable data
+    # @param result - SimResult:    Result of a point.
+    # @return list:                 The result as data.
+    def encode(self, result):
+        return list(result[1:6]) + [result.stats.toDict(), result.steady]
+
+    # Convert data back to a result
+    # @param config - SimConfig:    The point of the result.
+    # @param data - list:           The result as data (see encode()).
+    # @return SimResult:            The result.
+    def decode(self, config, data):
+        return SimResult(config, *data[:5], loadDelayStatistics(data[5]), data[6])
+
+# Run the CSMA/CD simulator based on the command line options provided
+# Can call 'python lab2.py --help' to view all options.
 def main():
-    global N
-    global A
-    global T
-    global persistent_simulation
-
     parser = argparse.ArgumentParser(description='Simulate CSMA/CD of nodes (ECE358 Lab 2)')
-    parser.add_argument('-A', '--arrival_rate', metavar='a', type=float, default=5.0,
-                        help='Average packet arrival rate [packets/second]')
-    parser.add_argument('-T', '--time', metavar='t', type=int, default=1000,
-                        help='Time of the simulation')    
+    parser.add_argument('-A', '--arrival_rate', metavar='a', type=float, nargs='+', default=[5.0],
+                        help='Average packet arrival rate(s) [packets/second]')
+    parser.add_argument('-N', '--nodes', metavar='n', type=int, nargs='+', default=list(range(20, 101, 20)),
+                        help='Number(s) of nodes (default: 20 40 60 80 100)')
+    parser.add_argument('-T', '--time', metavar='t', type=int, default=T,
+                        help='Time of the simulation')
     parser.add_argument('-P', '--non_persistent', action='store_true',
                         help='Non-persistent CSMA/CD simulation (default: persistent)')
+    parser.add_argument('-B', '--both', action='store_true',
+                        help='Simulate both persistent and non-persistent CSMA/CD')
+    parser.add_argument('--scheduler', choices=des.SCHEDULERS, default=des.SCHEDULER_CALENDAR,
+                        help='Pending event set of the simulation (default: calendar queue)')
+    parser.add_argument('-j', '--jobs', metavar='j', type=int, default=1,
+                        help='Number of worker processes (default: 1, 0 for one per CPU)')
+    parser.add_argument('-n', '--replications', metavar='n', type=int, default=1,
+                        help='Number of independent replications of each point, merged into one row (default: 1)')
+    parser.add_argument('-S', '--seed', metavar='s', type=int, default=None,
+                        help='Base seed for reproducible runs (default: unseeded)')
+    parser.add_argument('--profile', metavar='s', type=float, nargs='?', const=PROFILE_INTERVAL, default=None,
+                        help='Count events, time phases and report progress every s seconds of wall time '
+                             'as JSON on stderr (default interval: %g)' % PROFILE_INTERVAL)
+    parser.add_argument('--cache', metavar='dir', nargs='?', const=CACHE_DIR, default=None,
+                        help='Reuse the results of seeded points from an on-disk cache (default dir: .cache)')
+    parser.add_argument('--cache_limit', metavar='mb', type=float, default=CACHE_LIMIT,
+                        help='Size limit of the cache in MB (default: %g)' % CACHE_LIMIT)
+    parser.add_argument('--invalidate_cache', choices=['all', 'stale'], default=None,
+                        help='Remove all cached results, or only those of other simulator versions, and exit')
+    parser.add_argument('--trace', metavar='dir', default=None,
+                        help='Record the events of each point to a binary trace file in this directory')
+    parser.add_argument('--replay', metavar='file', default=None,
+                        help='Recompute the statistics of a run from a trace file instead of simulating')
+    parser.add_argument('--window', metavar='t', type=float, nargs=2, default=None,
+                        help='Only use the trace records between these two times with --replay')
+    parser.add_argument('--crn', action='store_true',
+                        help='Use common random numbers across all points (requires -S)')
+    parser.add_argument('--delays', action='store_true',
+                        help='Add the drop rate, mean, p50, p99 and p99.9 packet delay and mean access delay to each row')
+    parser.add_argument('--node_delays', action='store_true',
+                        help='Follow each row with the packet and delay statistics of every node')
+    parser.add_argument('--steady_state', metavar='p', type=float, default=None,
+                        help='Drop the warm-up of each run (MSER-5) and stop it once the 95%% confidence '
+                             'intervals of the efficiency and throughput are within this relative '
+                             'precision, e.g. 0.05; -T is then the longest run')
 
     args = parser.parse_args()
-    A = args.arrival_rate
-    T = args.time    
-    persistent_simulation = not args.non_persistent
-
-    print('# Nodes (N),Efficiency,Throughput [Mbps],End time [s]')
-    for n in range(20, 101, 20):
-        N = n
-        simulate()       
-
-#    N=1
-#    simulate()
+    if args.crn and args.seed is None:
+        parser.error('--crn requires a seed (-S)')
+    if args.steady_state is not None and args.replications > 1:
+        parser.error('--steady_state stops single runs and cannot be combined with -n')
+    if args.trace is not None:
+        os.makedirs(args.trace, exist_ok=True)
+
+    # Recompute the statistics of a recorded run
+    if args.replay is not None:
+        if np is None:
+            parser.error('--replay requires NumPy to be installed')
+        trace, _ = des.read_trace(args.replay, 'busy')
+        n = int(trace['node'].max()) + 1 if trace.size else 0
+        if args.window is not None:
+            trace = trace[(trace['time'] >= args.window[0]) & (trace['time'] < args.window[1])]
+        stats = traceStatistics(trace, n)
+        print('Efficiency,Throughput [Mbps],Drops,Mean delay [s]')
+        print('%r,%r,%d,%r' % (stats['efficiency'], stats['throughput'], stats['drops'], stats['delay']))
+        print('# Node,Mean delay [s]')
+        for i, delay in enumerate(stats['node_delays']):
+            print('%d,%r' % (i, delay))
+        return
+
+    cache = None
+    if args.cache is not None or args.invalidate_cache is not None:
+        cache = ResultCache(args.cache or CACHE_DIR, args.cache_limit)
+    if args.invalidate_cache is not None:
+        print('Removed %d cached results' % cache.invalidate(args.invalidate_cache == 'stale'))
+        cache.close()
+        return
+    if args.both:
+        persistences = [True, False]
+    else:
+        persistences = [not args.non_persistent]
+
+    configs = buildSweep(args.nodes, args.arrival_rate, persistences, args.time, args.seed, args.crn, args.profile, args.trace,
+                         args.scheduler, args.replications, args.steady_state)
+
+    block = None
+    replications = []
+    for _, result in des.run_sweep(runSweepPoint, configs, args.jobs, cache):
+        # The replications of a point follow each other and are merged into one row
+        replications.append(result)
+        if len(replications) < args.replications:
+            continue
+        if len(replications) > 1:
+            result = mergeResults(replications)
+        replications = []
+
+        # Each (persistence, arrival rate) pair gets its own block of CSV output
+        if (result.config.persistent, result.config.A) != block:
+            block = (result.config.persistent, result.config.A)
+            header = '# Nodes (N),Efficiency,Throughput [Mbps],End time [s]'
+            if args.steady_state is not None:
+                header = '# Nodes (N),Efficiency,Efficiency CI,Throughput [Mbps],Throughput CI,End time [s],Warm-up [s]'
+            if args.delays:
+                header += ',Drop rate,Mean delay [s],' + \
+                    ','.join('p%g delay [s]' % (100 * q) for q in DELAY_QUANTILES) + ',Mean access delay [s]'
+            print(header)
+        print(formatResult(result, args.delays), flush=True)
+        if args.node_delays:
+            print('# Node,Delivered,Dropped,Drop rate,Mean delay [s],Mean access delay [s]')
+            for i, node in enumerate(result.stats.summary()['nodes']):
+                print('%d,%d,%d,%r,%r,%r' % (i, node['delivered'], node['dropped'], node['drop_rate'],
+                                             node['delay'], node['access_delay']))
+
+    if cache is not None:
+        cache.close()
 
 # END MAIN
 
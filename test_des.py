@@ -0,0 +1,58 @@
+##########################################################################
+# Tests of the Discrete-Event Simulation Kernel (des.py)
+#
+# Run with 'python -m pytest' or 'python -m unittest' from the root.
+##########################################################################
+
+import random
+import unittest
+
+import des
+
+# Drive a heap and a calendar queue simulator with the same random mix of
+# schedules, cancels, pops and window queries, and check that both return
+# the same events at every step. Times are drawn from a few scales, and
+# with ties, so the calendar queue resizes and breaks ties by priority/seq.
+class TestSchedulers(unittest.TestCase):
+    OPERATIONS = 20000
+
+    def check(self, seed):
+        rng = random.Random(seed)
+        heap = des.Simulator(des.SCHEDULER_HEAP)
+        calendar = des.Simulator(des.SCHEDULER_CALENDAR)
+        pending = []
+        for _ in range(self.OPERATIONS):
+            op = rng.random()
+            if op < 0.45 or not pending:
+                scale = rng.choice([1e-6, 1e-3, 1.0, 1e3])
+                t = heap.now + (rng.choice([0.0, scale]) if rng.random() < 0.1 else rng.expovariate(1 / scale))
+                kind = rng.randrange(3)
+                event = heap.schedule(t, kind, len(pending))
+                self.assertEqual(event, calendar.schedule(t, kind, len(pending)))
+                pending.append(event)
+            elif op < 0.6:
+                event = pending.pop(rng.randrange(len(pending)))
+                heap.cancel(event)
+                calendar.cancel(event)
+            elif op < 0.9:
+                event = heap.next()
+                self.assertEqual(event, calendar.next())
+                pending.remove(event)
+                self.assertEqual(heap.now, calendar.now)
+            else:
+                t_start = heap.now + rng.expovariate(1.0)
+                t_end = t_start + rng.choice([1e-3, 1.0, 1e3])
+                self.assertEqual(sorted(heap.window(t_start, t_end)), sorted(calendar.window(t_start, t_end)))
+            self.assertEqual(heap.empty(), calendar.empty())
+
+        while not heap.empty():
+            self.assertEqual(heap.next(), calendar.next())
+        self.assertTrue(calendar.empty())
+        self.assertIsNone(calendar.next())
+
+    def test_same_order(self):
+        for seed in range(5):
+            self.check(seed)
+
+if __name__ == '__main__':
+    unittest.main()
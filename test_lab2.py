@@ -0,0 +1,53 @@
+##########################################################################
+# Tests of the CSMA/CD simulator (lab2/lab2.py)
+#
+# Run with 'python -m pytest' or 'python -m unittest' from the root.
+##########################################################################
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lab2'))
+import des
+import lab2
+
+# Back off the same busy nodes once in bulk (all nodes at once, with NumPy)
+# and once one node at a time (the loop), each from identically seeded
+# streams, and check that both leave the same start times, counters and
+# streams. Some nodes start at or past the end of their busy period, and
+# the busy periods range from under one backoff to past BACKOFF_CHAIN.
+@unittest.skipIf(lab2.np is None, 'the bulk backoff requires NumPy')
+class TestBackoffBusyNodes(unittest.TestCase):
+    NODES = 4 * lab2.BACKOFF_BULK
+
+    def streams(self, seed):
+        return [des.VariateStream(random.Random("%d:%d" % (seed, i)), lab2.VARIATE_BLOCK)
+                for i in range(self.NODES)]
+
+    def check(self, seed):
+        rng = random.Random(seed)
+        slot = 512 / lab2.R
+        t_trans = [rng.uniform(0, 1) for _ in range(self.NODES)]
+        c_channel_busy = [rng.randrange(11) for _ in range(self.NODES)]
+        busy = [(i, t_trans[i] + rng.choice([-1, 0, 1, 100, 10000]) * rng.random() * slot)
+                for i in range(self.NODES)]
+
+        bulk = (list(t_trans), list(c_channel_busy), self.streams(seed))
+        loop = (list(t_trans), list(c_channel_busy), self.streams(seed))
+        c_bulk = lab2.backoffBusyNodes(busy, *bulk)
+        c_loop = sum(lab2.backoffBusyNodes([node], *loop) for node in busy)
+
+        self.assertEqual(c_bulk, c_loop)
+        self.assertEqual(bulk[0], loop[0])
+        self.assertEqual(bulk[1], loop[1])
+        self.assertEqual([stream.uniform(0, 1) for stream in bulk[2]],
+                         [stream.uniform(0, 1) for stream in loop[2]])
+
+    def test_bulk_matches_loop(self):
+        for seed in range(5):
+            self.check(seed)
+
+if __name__ == '__main__':
+    unittest.main()